@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import cv2
+from camera_ingest_helper import IngestManager
+
+
+# ----------------- START OF Configs ---------------------
+# Webcam indexes / stream URLs are treated as live cameras,
+# video files are looped so they can stand in for live cameras.
+# simulate_drop_at_eof: a file's end goes through the camera drop / backoff / reconnect path instead.
+sources = {
+    'entrance': '../Demo/TestVideo.avi',
+    'hall': '../Demo/4088949254922987959.mp4',
+    'webcam': 0
+}
+loop_files = True
+simulate_drop_at_eof = False
+show_results = True
+resized_width, resized_height = (640, 360)
+health_interval = 5  # seconds between health reports
+# ----------------- END OF Configs -----------------
+
+
+async def main():
+    async with IngestManager(sources=sources, loop_files=loop_files, simulate_drop_at_eof=simulate_drop_at_eof,
+                             resize=(resized_width, resized_height)) as manager:
+        last_report = time.time()
+
+        while True:
+            for name in manager.streams:
+                latest = manager.get_latest(name)
+                if latest is None:
+                    continue
+
+                frame_id, timestamp, frame = latest
+                if show_results:
+                    cv2.imshow(f'Camera Ingest: {name}', frame)
+
+            if time.time() - last_report > health_interval:
+                last_report = time.time()
+                for name, health in manager.health().items():
+                    print(name, health)
+
+            if show_results:
+                key = cv2.waitKey(10)
+                if key == 27:
+                    break
+
+            await asyncio.sleep(0.03)
+
+    cv2.destroyAllWindows()
+
+
+asyncio.run(main())
@@ -0,0 +1,333 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+
+import cv2
+
+
+class DaemonExecutor(Executor):
+    '''
+    Bounded pool of daemon worker threads for the blocking cv2 calls.
+
+    concurrent.futures.ThreadPoolExecutor joins its workers at interpreter exit, so a read stuck
+    inside a dead camera driver would keep the process alive forever. Daemon threads do not.
+    '''
+
+    def __init__(self, max_workers, thread_name_prefix = 'ingest') -> None:
+        self.work = queue.SimpleQueue()
+        self.shutting_down = False
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f'{thread_name_prefix}_{i}', daemon=True).start()
+        self.max_workers = max_workers
+
+    def submit(self, fn, *args, **kwargs):
+        if self.shutting_down:
+            raise RuntimeError('cannot schedule new calls after shutdown')
+        future = Future()
+        self.work.put((future, fn, args, kwargs))
+        return future
+
+    def _worker(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    def shutdown(self, wait = True, *, cancel_futures = False):
+        # wait is ignored: stuck workers are daemon threads and never block the exit
+        self.shutting_down = True
+        if cancel_futures:
+            while True:
+                try:
+                    item = self.work.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in range(self.max_workers):
+            self.work.put(None)
+
+
+class Stream:
+    def __init__(self, name, src, loop_file = False, realtime = True, resize = None,
+                 simulate_drop_at_eof = False) -> None:
+        self.name = name
+        self.src = src
+        self.is_live = type(src) is int or (type(src) is str and '://' in src)
+        self.loop_file = loop_file
+        self.simulate_drop_at_eof = simulate_drop_at_eof and not self.is_live
+        self.realtime = realtime
+        self.resize = resize
+
+        self.cap = None
+        self.file_fps = None
+        self.pending_read = None  # at most one blocking call in flight per stream
+
+        self.latest = None  # (frame_id, timestamp, frame) --> only the newest frame is kept
+        self.consumed_id = -1
+        self.new_frame = asyncio.Event()
+
+        self.status = 'connecting'
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.backoff = 0.0
+        self.last_error = None
+        self.last_frame_time = None
+        self.fps = 0.0
+
+    def health(self):
+        now = time.time()
+        return {
+            'status': self.status,
+            'frames_read': self.frames_read,
+            'frames_dropped': self.frames_dropped,
+            'reconnects': self.reconnects,
+            'fps': round(self.fps, 2),
+            'backoff': self.backoff,
+            'seconds_since_last_frame': None if self.last_frame_time is None else round(now - self.last_frame_time, 2),
+            'last_error': self.last_error
+        }
+
+
+class IngestManager:
+    '''
+    Reads many video sources concurrently and keeps only the latest frame of each one.
+
+    Blocking cv2 calls run in a bounded thread pool, and every stream has at most one call in flight,
+    so a stuck camera holds a single worker instead of stalling the others.
+    Live sources (webcam index or URL) are reopened with exponential backoff when they drop.
+    Video files can be looped (loop_files=True) to stand in for live cameras.
+    With simulate_drop_at_eof=True a file's end is handled like a dropped camera instead
+    (release, backoff, reopen from the start), so reconnects and health can be checked without a camera.
+    '''
+
+    def __init__(self, sources, max_workers = None, loop_files = False, realtime = True, resize = None,
+                 read_timeout = 5.0, initial_backoff = 0.5, max_backoff = 30.0,
+                 simulate_drop_at_eof = False) -> None:
+        if not isinstance(sources, dict):
+            sources = {f'cam_{i}': src for i, src in enumerate(sources)}
+
+        self.streams = {
+            name: Stream(name=name, src=src, loop_file=loop_files, realtime=realtime, resize=resize,
+                         simulate_drop_at_eof=simulate_drop_at_eof)
+            for name, src in sources.items()
+        }
+
+        # One worker per stream by default: a stream never uses more than one, so nobody starves.
+        self.max_workers = max_workers or max(len(self.streams), 1)
+        self.read_timeout = read_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.executor = None
+        self.tasks = {}
+        self.running = False
+
+    async def start(self):
+        self.executor = DaemonExecutor(max_workers=self.max_workers, thread_name_prefix='ingest')
+        self.running = True
+        for name, stream in self.streams.items():
+            self.tasks[name] = asyncio.create_task(self._run_stream(stream), name=f'ingest-{name}')
+
+    async def stop(self):
+        self.running = False
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks = {}
+
+        for stream in self.streams.values():
+            stream.status = 'stopped'
+            stream.new_frame.set()  # wake up consumers
+            if stream.pending_read is None or stream.pending_read.done():
+                self._release(stream)
+
+        # Do not wait for reads stuck inside a dead camera driver.
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def health(self):
+        return {name: stream.health() for name, stream in self.streams.items()}
+
+    def get_latest(self, name):
+        '''Return (frame_id, timestamp, frame) of the newest frame, or None. Never blocks.'''
+        stream = self.streams[name]
+        if stream.latest is not None:
+            stream.consumed_id = stream.latest[0]
+        return stream.latest
+
+    async def wait_frame(self, name, timeout = None):
+        '''Wait for a frame newer than the last one handed out for this stream.'''
+        stream = self.streams[name]
+        while stream.latest is None or stream.latest[0] <= stream.consumed_id:
+            if stream.status in ('finished', 'failed', 'stopped'):
+                return None
+            stream.new_frame.clear()
+            try:
+                await asyncio.wait_for(stream.new_frame.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.get_latest(name)
+
+    async def frames(self, name):
+        '''Async generator over the newest frames of one stream; stale frames are skipped.'''
+        while self.running:
+            item = await self.wait_frame(name)
+            if item is None:
+                return
+            yield item
+
+    # ----------------- internals -----------------
+
+    async def _call(self, stream, fn, *args):
+        loop = asyncio.get_running_loop()
+        stream.pending_read = loop.run_in_executor(self.executor, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(stream.pending_read), timeout=self.read_timeout)
+        except asyncio.TimeoutError:
+            stream.status = 'stalled'
+            stream.last_error = f'{getattr(fn, "__name__", "call")} timed out after {self.read_timeout}s'
+            # Keep the worker slot accounted for: wait for the stuck call before touching the capture again.
+            while not stream.pending_read.done():
+                await asyncio.sleep(self.read_timeout)
+            raise ConnectionError(stream.last_error)
+
+    def _open(self, stream):
+        cap = cv2.VideoCapture(stream.src)
+        if not cap.isOpened():
+            cap.release()
+            return None, None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return cap, (fps if fps and fps > 0 else None)
+
+    def _read(self, stream):
+        ret, frame = stream.cap.read()
+        if not ret and stream.loop_file and not stream.is_live and not stream.simulate_drop_at_eof:
+            stream.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = stream.cap.read()
+        if ret and stream.resize is not None:
+            frame = cv2.resize(frame, stream.resize)
+        return ret, frame
+
+    def _release(self, stream):
+        if stream.cap is not None:
+            stream.cap.release()
+            stream.cap = None
+
+    async def _wait_backoff(self, stream):
+        stream.backoff = self.initial_backoff if stream.backoff == 0 else min(stream.backoff * 2, self.max_backoff)
+        await asyncio.sleep(stream.backoff)
+
+    async def _run_stream(self, stream):
+        while self.running:
+            try:
+                stream.cap, stream.file_fps = await self._call(stream, self._open, stream)
+                if stream.cap is None:
+                    stream.last_error = f'Unable to open source: {stream.src}'
+            except ConnectionError:
+                stream.cap = None
+                await self._release_late_open(stream)
+
+            if stream.cap is None:
+                if not stream.is_live and stream.status != 'stalled':
+                    # A file that cannot be opened will not start working later
+                    stream.status = 'failed'
+                    return
+                stream.status = 'reconnecting'
+                stream.reconnects += 1
+                await self._wait_backoff(stream)
+                continue
+
+            stream.status = 'live'
+            stream.last_error = None
+
+            await self._read_loop(stream)
+
+            await self._call_release(stream)
+            if stream.status == 'finished':
+                return
+
+            stream.status = 'reconnecting'
+            stream.reconnects += 1
+            await self._wait_backoff(stream)
+
+    async def _read_loop(self, stream):
+        frame_interval = None
+        if not stream.is_live and stream.realtime and stream.file_fps:
+            frame_interval = 1.0 / stream.file_fps
+
+        next_due = time.monotonic()
+        while self.running:
+            try:
+                ret, frame = await self._call(stream, self._read, stream)
+            except ConnectionError:
+                return
+
+            if not ret:
+                if stream.is_live:
+                    stream.last_error = 'Camera returned no frame'
+                elif stream.simulate_drop_at_eof:
+                    stream.last_error = 'End of file (simulated camera drop)'
+                else:
+                    stream.status = 'finished'
+                return
+
+            now = time.time()
+            if stream.last_frame_time is not None:
+                dt = max(now - stream.last_frame_time, 1e-6)
+                stream.fps = 0.9 * stream.fps + 0.1 * (1.0 / dt) if stream.fps else 1.0 / dt
+            stream.last_frame_time = now
+            stream.backoff = 0.0
+
+            frame_id = stream.frames_read
+            stream.frames_read += 1
+            if stream.latest is not None and stream.latest[0] > stream.consumed_id:
+                stream.frames_dropped += 1
+            stream.latest = (frame_id, now, frame)
+            stream.new_frame.set()
+
+            if frame_interval is not None:
+                # Pace looped files like a camera instead of decoding as fast as the CPU allows.
+                next_due += frame_interval
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    next_due = time.monotonic()
+            else:
+                await asyncio.sleep(0)
+
+    async def _release_late_open(self, stream):
+        # _open timed out but finished later (_call waits for it): release the capture it returned
+        late = stream.pending_read
+        if late is None or not late.done() or late.cancelled() or late.exception() is not None:
+            return
+        cap, _ = late.result()
+        if cap is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, cap.release)
+
+    async def _call_release(self, stream):
+        if stream.cap is None:
+            return
+        if stream.pending_read is not None and not stream.pending_read.done():
+            return
+        loop = asyncio.get_running_loop()
+        cap, stream.cap = stream.cap, None
+        await loop.run_in_executor(self.executor, cap.release)
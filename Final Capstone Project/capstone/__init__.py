@@ -0,0 +1,4 @@
+# Command line entry point for the capstone demos, run from the `Final Capstone Project` directory:
+#   python -m capstone count  --src ../Demo/TestVideo.avi --show
+#   python -m capstone loiter --src 0 --export-format openvino
+#   python -m capstone faces  --src film.mp4 --output output_film.mp4
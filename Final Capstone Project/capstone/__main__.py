@@ -0,0 +1,4 @@
+from capstone.cli import main
+
+
+main()
@@ -0,0 +1,257 @@
+import argparse
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Only light modules at top level: cv2 / ultralytics / keras are imported by the chosen subcommand.
+START_TIME = time.perf_counter()
+
+
+def parse_src(src):
+    # Webcam indexes are given as integers on the command line
+    return int(src) if src.isdigit() else src
+
+
+def parse_points(text):
+    values = [int(value) for value in text.split(',')]
+    return [tuple(values[i:i + 2]) for i in range(0, len(values), 2)]
+
+
+def open_source(src):
+    import cv2
+
+    cap = cv2.VideoCapture(src)
+    if not cap.isOpened():
+        raise SystemExit(f'Error: Unable to open source {src}')
+    return cap
+
+
+def load_tracker_model(args, helper_module):
+    # helper_module is imported here, in the loading thread, together with ultralytics
+    from capstone.model_cache import load_yolo
+
+    yolo_model = load_yolo(args.yolo_model_path, export_format=args.export_format, imgsz=args.imgsz,
+                           half=args.half, dynamic=args.adaptive_imgsz, cache_dir=args.cache_dir)
+    if not args.no_warmup:
+        tracker_class = importlib.import_module(helper_module).Tracker
+        tracker = tracker_class(yolo_model_path=args.yolo_model_path, yolo_model=yolo_model, imgsz=args.imgsz)
+        tracker.warmup(width=args.width, height=args.height)
+    return yolo_model
+
+
+def build_resolution_controller(args):
+    if not args.adaptive_imgsz:
+        return None
+    from capstone.resolution import ResolutionController
+    return ResolutionController(default_imgsz=args.imgsz, latency_budget=args.latency_budget)
+
+
+def run_frames(args, cap, process, window_name, on_key = None):
+    import cv2
+
+    width, height = args.width, args.height
+    out = None
+    if args.output:
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        out = cv2.VideoWriter(args.output, fourcc, 20.0, (width, height))
+
+    is_live = type(args.src) is int
+    reconnect_backoff = 0
+    fr_count = -1
+    prev_results = None
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            if not is_live:
+                break
+            # Camera dropped: reopen with exponential backoff instead of spinning on cap.read()
+            reconnect_backoff = min(reconnect_backoff * 2, 30) if reconnect_backoff else 0.5
+            time.sleep(reconnect_backoff)
+            cap.release()
+            cap = cv2.VideoCapture(args.src)
+            continue
+        reconnect_backoff = 0
+
+        fr_count += 1
+        skip_fr = fr_count % args.frs_skip != 0
+
+        frame = cv2.resize(frame, (width, height))
+
+        prev_results = process(frame, skip_fr, prev_results)
+
+        if fr_count == 0:
+            print(f'First result after {time.perf_counter() - START_TIME:.2f}s')
+
+        if args.show:
+            cv2.imshow(window_name, frame)
+
+            key = cv2.waitKey(10)
+            if key == 27:
+                break
+            if on_key is not None:
+                on_key(key, prev_results)
+
+        if out is not None:
+            out.write(frame)
+
+    cv2.destroyAllWindows()
+    if out is not None:
+        out.release()
+    cap.release()
+
+
+def count(args):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # Model loading (import + weights + warm-up) overlaps with opening the source
+        model_future = pool.submit(load_tracker_model, args, 'object_counting.object_counting_helper')
+        cap = open_source(args.src)
+
+        if args.entry_line and args.exit_line and args.inside_point and args.outside_point:
+            entry_line, exit_line = parse_points(args.entry_line), parse_points(args.exit_line)
+            sample_inside_point, sample_outside_point = parse_points(args.inside_point)[0], parse_points(args.outside_point)[0]
+        else:
+            from object_counting.config import open_config
+            entry_line, exit_line, sample_inside_point, sample_outside_point = open_config(src=args.src, resized_width=args.width, resized_height=args.height)
+
+        yolo_model = model_future.result()
+
+    from object_counting.object_counting_helper import Counter
+
+    counter = Counter(yolo_model_path=args.yolo_model_path, yolo_threshold=args.yolo_threshold,
+                      entry_line=entry_line, exit_line=exit_line,
+                      sample_inside_point=sample_inside_point, sample_outside_point=sample_outside_point,
+                      yolo_model=yolo_model, imgsz=args.imgsz,
+                      resolution_controller=build_resolution_controller(args))
+
+    def process(frame, skip_fr, prev_results):
+        return counter.run(frame=frame, skip_fr=skip_fr, prev_results=prev_results)
+
+    run_frames(args, cap, process, window_name=f'People Counting: {args.src}')
+
+
+def loiter(args):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        model_future = pool.submit(load_tracker_model, args, 'loitering_detection.loitering_detection_helper')
+        cap = open_source(args.src)
+        yolo_model = model_future.result()
+
+    from loitering_detection.loitering_detection_helper import Detector
+
+    detector = Detector(yolo_model_path=args.yolo_model_path,
+                        max_time=args.max_time,
+                        min_movement=args.min_movement,
+                        fps_tracking=args.fps_tracking,
+                        yolo_threshold=args.yolo_threshold,
+                        yolo_model=yolo_model, imgsz=args.imgsz,
+                        resolution_controller=build_resolution_controller(args))
+
+    def process(frame, skip_fr, prev_results):
+        loiterings, current_people = detector.run(frame=frame, skip_fr=skip_fr, prev_results=prev_results)
+        return {
+            'loiterings': loiterings,
+            'current_people': current_people
+        }
+
+    def on_key(key, prev_results):
+        if key == 99:  # c pressed --> clear loiterings
+            detector.clear(loiterings=prev_results['loiterings'])
+
+    run_frames(args, cap, process, window_name=f'Loitering Detection: {args.src}', on_key=on_key)
+
+
+def faces(args):
+    def load_predictor():
+        from emotion_gender_age.emotion_gender_age_helper import Predictor
+
+        predictor = Predictor(emotion_model_path=args.emotion_model_path,
+                              emotion_class_indices_file=args.emotion_class_indices_file,
+                              age_model_path=args.age_model_path,
+                              gender_model_path=args.gender_model_path,
+                              gender_class_indices_file=args.gender_class_indices_file,
+                              detect_threshold=args.detect_threshold)
+        if not args.no_warmup:
+            predictor.warmup(width=args.width, height=args.height)
+        return predictor
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        predictor_future = pool.submit(load_predictor)
+        cap = open_source(args.src)
+        predictor = predictor_future.result()
+
+    def process(frame, skip_fr, prev_results):
+        _, current_results = predictor.predict_image(frame, skip_fr=skip_fr, prev_results=prev_results)
+        return current_results
+
+    run_frames(args, cap, process, window_name=f'Emotion - Gender - Age: {args.src}')
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--src', type=parse_src, required=True, help='video path, stream URL or webcam index')
+    parser.add_argument('--output', default=None, help='write the annotated video to this path')
+    parser.add_argument('--show', action='store_true', help='display results in a window')
+    parser.add_argument('--frs-skip', type=int, default=1, help='run inference on every n-th frame only')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--no-warmup', action='store_true', help='skip the warm-up inference')
+
+
+def add_yolo_arguments(parser):
+    parser.add_argument('--yolo-model-path', default='yolov8s.pt')
+    parser.add_argument('--yolo-threshold', type=float, default=0.5)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--export-format', default=None,
+                        help='load through a cached export (torchscript, onnx, openvino, engine, ...)')
+    parser.add_argument('--half', action='store_true', help='FP16 export')
+    parser.add_argument('--cache-dir', default=None, help='where exported models are cached')
+    parser.add_argument('--adaptive-imgsz', action='store_true',
+                        help='choose imgsz per frame from recent box sizes (.pt weights, or an onnx / openvino export made dynamic)')
+    parser.add_argument('--latency-budget', type=float, default=None, help='seconds per inference for --adaptive-imgsz')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m capstone', description='DAT301m capstone video analytics')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    count_parser = subparsers.add_parser('count', help='people counting across entry / exit lines')
+    add_common_arguments(count_parser)
+    add_yolo_arguments(count_parser)
+    count_parser.add_argument('--entry-line', help='x1,y1,x2,y2 (opens the line picker when omitted)')
+    count_parser.add_argument('--exit-line', help='x1,y1,x2,y2')
+    count_parser.add_argument('--inside-point', help='x,y')
+    count_parser.add_argument('--outside-point', help='x,y')
+    count_parser.set_defaults(func=count)
+
+    loiter_parser = subparsers.add_parser('loiter', help='loitering detection')
+    add_common_arguments(loiter_parser)
+    add_yolo_arguments(loiter_parser)
+    loiter_parser.add_argument('--max-time', type=float, default=3)
+    loiter_parser.add_argument('--min-movement', type=float, default=200)
+    loiter_parser.add_argument('--fps-tracking', type=int, default=5)
+    loiter_parser.set_defaults(func=loiter)
+
+    faces_parser = subparsers.add_parser('faces', help='emotion, gender and age prediction')
+    add_common_arguments(faces_parser)
+    faces_parser.add_argument('--emotion-model-path', default='emotion_model_v1_89.keras')
+    faces_parser.add_argument('--emotion-class-indices-file', default='emotion_class_indices.json')
+    faces_parser.add_argument('--age-model-path', default='agemodel_asian_vgg16.keras')
+    faces_parser.add_argument('--gender-model-path', default='gen_model_utk.keras')
+    faces_parser.add_argument('--gender-class-indices-file', default='gender_class_indices.json')
+    faces_parser.add_argument('--detect-threshold', type=float, default=0.8)
+    faces_parser.set_defaults(func=faces)
+
+    return parser
+
+
+def main(argv = None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'adaptive_imgsz', False) and args.export_format is not None:
+        from capstone.model_cache import DYNAMIC_EXPORT_FORMATS
+        if args.export_format not in DYNAMIC_EXPORT_FORMATS:
+            # A static export fails as soon as the controller picks another imgsz
+            parser.error(f'--adaptive-imgsz needs .pt weights or --export-format {" / ".join(DYNAMIC_EXPORT_FORMATS)}')
+    if getattr(args, 'cache_dir', False) is None:
+        from capstone.model_cache import DEFAULT_CACHE_DIR
+        args.cache_dir = DEFAULT_CACHE_DIR
+    args.func(args)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import shutil
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dat301m_capstone')
+
+
+def weights_hash(weights_path, chunk_size = 1 << 20):
+    sha256 = hashlib.sha256()
+    with open(weights_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def cached_artifact_path(weights_path, artifact_name, cache_dir = DEFAULT_CACHE_DIR):
+    '''Path of an artifact derived from weights_path. Changing the weights changes the key.'''
+    return os.path.join(cache_dir, weights_hash(weights_path)[:16], artifact_name)
+
+
+# Formats whose export can take dynamic input shapes (needed when imgsz changes between frames)
+DYNAMIC_EXPORT_FORMATS = ('onnx', 'openvino')
+
+
+def load_yolo(weights_path, export_format = None, imgsz = 640, half = False, dynamic = False,
+              cache_dir = DEFAULT_CACHE_DIR):
+    '''
+    Load a YOLO model, optionally through an exported artifact (torchscript, onnx, openvino, engine, ...).
+
+    The export runs only once per (weights hash, format, imgsz, half, dynamic); later starts load the
+    cached artifact directly. dynamic=True exports with dynamic input shapes (DYNAMIC_EXPORT_FORMATS only).
+    '''
+    from ultralytics import YOLO
+
+    if export_format is None:
+        return YOLO(weights_path)
+
+    model = None
+    weights_file = weights_path
+    if not os.path.isfile(weights_path):
+        # e.g. 'yolov8s.pt' on a fresh machine: let ultralytics download it, then hash the file it resolved to
+        model = YOLO(weights_path)
+        weights_file = str(getattr(model, 'ckpt_path', None) or weights_path)
+
+    base_name = os.path.splitext(os.path.basename(weights_path))[0]
+    artifact_name = f'{base_name}_{export_format}_{imgsz}{"_half" if half else ""}{"_dynamic" if dynamic else ""}'
+    artifact_dir = cached_artifact_path(weights_file, artifact_name, cache_dir=cache_dir)
+
+    if os.path.isdir(artifact_dir) and os.listdir(artifact_dir):
+        return YOLO(os.path.join(artifact_dir, os.listdir(artifact_dir)[0]), task='detect')
+
+    if model is None:
+        model = YOLO(weights_file)
+    exported_path = model.export(format=export_format, imgsz=imgsz, half=half, dynamic=dynamic)
+
+    # Move the export next to the other cached artifacts; rename at the end so a crash never leaves a half-written entry.
+    tmp_dir = artifact_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    target_path = os.path.join(tmp_dir, os.path.basename(str(exported_path).rstrip(os.sep)))
+    shutil.move(str(exported_path), target_path)
+    shutil.rmtree(artifact_dir, ignore_errors=True)
+    os.replace(tmp_dir, artifact_dir)
+
+    return YOLO(os.path.join(artifact_dir, os.path.basename(target_path)), task='detect')
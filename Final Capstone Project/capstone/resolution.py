@@ -0,0 +1,109 @@
+from collections import deque
+
+
+class ResolutionController:
+    '''
+    Chooses the inference imgsz for Tracker.track from recent box sizes and a latency budget.
+
+    Large subjects --> lower imgsz (faster), small subjects --> higher imgsz.
+    Boxes come back in original frame coordinates whatever imgsz is used, so nothing downstream changes.
+
+    People too small for the current imgsz are often not detected at all, so every `probe_interval`
+    frames one inference runs at `probe_imgsz` (the largest size by default) to find them.
+    '''
+
+    def __init__(self, sizes = (320, 416, 512, 640, 800, 960, 1280), default_imgsz = 640,
+                 min_box_side = 24, latency_budget = None, window = 30, patience = 10,
+                 recent_frames = 3, probe_interval = 30, probe_imgsz = None) -> None:
+        self.sizes = sorted(sizes)
+        self.default_imgsz = default_imgsz
+        self.min_box_side = min_box_side  # smallest box side (in inference pixels) we still want to detect well
+        self.latency_budget = latency_budget  # seconds per inference, None = no limit
+        self.patience = patience  # frames to wait before lowering the resolution
+        self.probe_interval = probe_interval  # frames between probe inferences, 0 / None = no probes
+        self.probe_imgsz = probe_imgsz or self.sizes[-1]  # probes ignore the latency budget
+
+        self.imgsz = default_imgsz
+        self.small_box_sides = deque(maxlen=window)  # per frame: smallest box side in frame pixels
+        self.recent_small_sides = deque(maxlen=recent_frames)  # same, last few frames only: used to raise
+        self.frames_without_people = 0
+        self.frames_since_probe = 0
+        self.window = window
+        self.latency = {}  # imgsz -> moving average of inference seconds
+        self.lower_count = 0
+
+    def next_imgsz(self):
+        # imgsz for the next inference: the current one, or probe_imgsz every probe_interval frames
+        self.frames_since_probe += 1
+        if self.probe_interval and self.imgsz < self.probe_imgsz and self.frames_since_probe >= self.probe_interval:
+            self.frames_since_probe = 0
+            return self.probe_imgsz
+        return self.imgsz
+
+    def update(self, boxes, frame_shape, imgsz, latency):
+        # boxes: xywh of the people detected in this frame (frame pixels), imgsz: size they were detected at
+        prev = self.latency.get(imgsz)
+        self.latency[imgsz] = latency if prev is None else 0.8 * prev + 0.2 * latency
+
+        if boxes:
+            small_side = min(min(box_width, box_height) for x_center, y_center, box_width, box_height in boxes)
+            self.small_box_sides.append(small_side)
+            self.recent_small_sides.append(small_side)
+            self.frames_without_people = 0
+        else:
+            self.frames_without_people += 1
+            if self.frames_without_people >= self.window:
+                self.small_box_sides.clear()
+                self.recent_small_sides.clear()
+
+        # Raise immediately on the smallest box of the last few frames: small people must not be missed
+        recent_imgsz = self.sizes[0]
+        if self.recent_small_sides:
+            recent_imgsz = self.imgsz_for_side(min(self.recent_small_sides), frame_shape)
+        if recent_imgsz > self.imgsz:
+            self.imgsz = recent_imgsz
+            self.lower_count = 0
+            return self.imgsz
+
+        # Lower only when the whole window agrees for `patience` frames and no small box was seen recently
+        desired = max(self.desired_imgsz(frame_shape), recent_imgsz)
+        if desired < self.imgsz:
+            self.lower_count += 1
+            if self.lower_count >= self.patience:
+                self.imgsz = desired
+                self.lower_count = 0
+        else:
+            self.lower_count = 0
+
+        return self.imgsz
+
+    def desired_imgsz(self, frame_shape):
+        if not self.small_box_sides:
+            return self.imgsz_for_side(None, frame_shape)
+        # 20th percentile of recent smallest boxes: robust to a single far-away false positive
+        sides = sorted(self.small_box_sides)
+        return self.imgsz_for_side(sides[len(sides) // 5], frame_shape)
+
+    def imgsz_for_side(self, small_side, frame_shape):
+        if small_side is None:
+            needed = self.default_imgsz
+        else:
+            # The letterbox scales the longest frame side to imgsz
+            needed = self.min_box_side * max(frame_shape[:2]) / max(small_side, 1)
+
+        imgsz = next((size for size in self.sizes if size >= needed), self.sizes[-1])
+
+        if self.latency_budget is not None:
+            while imgsz > self.sizes[0] and self.estimate_latency(imgsz) > self.latency_budget:
+                imgsz = self.sizes[self.sizes.index(imgsz) - 1]
+
+        return imgsz
+
+    def estimate_latency(self, imgsz):
+        if imgsz in self.latency:
+            return self.latency[imgsz]
+        if not self.latency:
+            return 0.0
+        # Cost grows with the number of pixels
+        measured = min(self.latency, key=lambda size: abs(size - imgsz))
+        return self.latency[measured] * (imgsz / measured) ** 2
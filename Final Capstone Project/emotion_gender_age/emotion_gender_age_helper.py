@@ -0,0 +1,257 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import keras
+import numpy as np
+from keras.utils import img_to_array
+from tqdm import tqdm
+from yoloface import face_analysis
+
+
+def load_class_indices(class_indices_file):
+    with open(class_indices_file, 'r') as file:
+        class_indices = json.load(file)
+    return {value: key for key, value in class_indices.items()}
+
+
+class Predictor():
+    def __init__(self, emotion_model_path, emotion_class_indices_file,
+                 age_model_path,
+                 gender_model_path, gender_class_indices_file,
+                 detect_threshold = 0.8) -> None:
+        # Load the three Keras models and the face detector concurrently instead of one after another
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            emotion_model = pool.submit(keras.models.load_model, filepath=emotion_model_path)
+            age_model = pool.submit(keras.models.load_model, filepath=age_model_path)
+            gender_model = pool.submit(keras.models.load_model, filepath=gender_model_path)
+            face = pool.submit(face_analysis)
+
+            self.emotion_class_indices = load_class_indices(emotion_class_indices_file)
+            self.gender_class_indices = load_class_indices(gender_class_indices_file)
+
+            self.emotion_model = emotion_model.result()
+            self.age_model = age_model.result()
+            self.gender_model = gender_model.result()
+            self.face = face.result()
+
+        self.detect_threshold = detect_threshold
+
+    def warmup(self, width = 1280, height = 720):
+        # Pay the one-time graph building / allocation cost before the first real frame
+        self.face.face_detection(frame_arr=np.zeros((height, width, 3), dtype=np.uint8), frame_status=True, model='full')
+        self.emotion_model.predict(np.zeros((1, 48, 48, 3), dtype=np.float32), verbose=0)
+        self.age_model.predict(np.zeros((1, 200, 200, 3), dtype=np.float32), verbose=0)
+        self.gender_model.predict(np.zeros((1, 200, 200, 3), dtype=np.float32), verbose=0)
+
+    def predict_image(self, bgr_img,
+                      skip_fr = False, prev_results = None):
+        if skip_fr:
+            for face in prev_results:
+                box = face['box']
+                emotion, age, gender = face['emotion'], face['age'], face['gender']
+
+                x_top_left, y_top_left, height, width = box
+                face_location = (y_top_left, x_top_left + width, y_top_left + height, x_top_left)
+                self.write_label(bgr_img, face_location, emotion, kind='emotion')
+                self.write_label(bgr_img, face_location, gender, kind='gender')
+                self.write_label(bgr_img, face_location, f'{age} years old.', kind='age')
+
+            return bgr_img, prev_results
+
+
+        img, boxes, confs = self.face.face_detection(frame_arr=bgr_img, frame_status=True, model='full')
+
+
+        results = []
+
+        for box, conf in zip(boxes, confs):
+            if conf < self.detect_threshold:
+                continue
+
+            x_top_left, y_top_left, height, width = box
+            # Crop face
+            face = bgr_img[y_top_left : y_top_left + height, x_top_left : x_top_left + width]
+
+            try:
+                rgb_face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+            except:
+                continue
+
+            self.plot_bbox(bgr_img, box=box)
+
+            # top, right, bottom, left = face_location
+            face_location = (y_top_left, x_top_left + width, y_top_left + height, x_top_left)
+
+            emotion = self.predict_emotion(rgb_face)
+            self.write_label(bgr_img, face_location, emotion, kind='emotion')
+
+            age, gender = self.predict_age_gender(rgb_face)
+            self.write_label(bgr_img, face_location, gender, kind='gender')
+            self.write_label(bgr_img, face_location, f'{age} years old.', kind='age')
+
+            results.append({
+                'box': box,
+                'emotion': emotion,
+                'age': age,
+                'gender': gender
+            })
+
+        return bgr_img, results
+
+
+    def predict_video(self, video_path,
+                      output_filename = 'output_video.mp4'):
+        self.predict_video_fast(video_path=video_path, output_filename=output_filename, fr_skip=1)
+
+
+    def predict_video_fast(self, video_path,
+                           output_filename = 'output_video.mp4',
+                           fr_skip = 10):
+
+        cap = cv2.VideoCapture(video_path)
+
+        # Check if the video file opened successfully
+        if not cap.isOpened():
+            print("Error: Could not open video file.")
+            return
+
+        # Get the total number of frames
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # Get the frames per second (FPS) of the video
+        fps = cap.get(cv2.CAP_PROP_FPS)
+
+        # Set the video filename and codec
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # You can also use 'XVID' or 'MJPG' as the codec
+
+        # Set the video dimensions and frames per second
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # Create VideoWriter object
+        out = cv2.VideoWriter(output_filename, fourcc, fps, (width, height))
+
+        prev_results = None
+
+        for i in tqdm(range(total_frames)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            skip_fr = False
+
+            if i % fr_skip != 0:
+                skip_fr = True
+
+            predicted_frame, current_results = self.predict_image(frame, skip_fr=skip_fr, prev_results=prev_results)
+            out.write(predicted_frame)
+
+            prev_results = current_results
+
+        out.release()
+        cap.release()
+
+        print('Video written successfully.', output_filename)
+
+    def show_image(self, bgr_img, resized = None, title = None, axis = 'off'):
+        import matplotlib.pyplot as plt
+
+        if resized:
+            bgr_img = cv2.resize(bgr_img, resized)
+        # Chuyển đổi không gian màu từ BGR sang RGB
+        rgb_img = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2RGB)
+
+        plt.imshow(rgb_img)
+        if title:
+            plt.title(title)
+        plt.axis(axis)
+        plt.show()
+
+
+    def predict_emotion(self, frame_rgb):
+        # Thay đổi kích thước ảnh thành (48, 48)
+        resized_frame = cv2.resize(frame_rgb, (48, 48))
+        # Chuyển đổi ảnh sang mảng NumPy
+        arr = img_to_array(resized_frame)
+        # Chuẩn hóa giá trị pixel về khoảng [0, 1]
+        arr /= 255
+        # Thêm một chiều vào shape để tạo thành batch
+        arr = np.expand_dims(arr, axis=0)
+
+        predictions = self.emotion_model.predict(arr, verbose=0)
+
+        # Get the predicted class index
+        predicted_class_index = np.argmax(predictions)
+        # Get the predicted class label:
+        predicted_class = self.emotion_class_indices[predicted_class_index]
+
+        return predicted_class
+
+
+    def predict_age_gender(self, rgb_img):
+        img = cv2.resize(rgb_img, (200, 200))
+        arr = img.astype(float)
+        arr /= 255
+        arr = np.expand_dims(arr, axis = 0)
+
+        ages = self.age_model.predict(arr, verbose = 0)
+        genders = self.gender_model.predict(arr, verbose = 0)
+
+        age = round(ages[0][0])
+
+        gender = round(genders[0][0])
+        gender = self.gender_class_indices[gender].capitalize()
+
+        return age, gender
+
+
+    def plot_bbox(self, img, box, BGR_color = (0, 255, 0), thickness = 2):
+        x_top_left, y_top_left, height, width = box
+        cv2.rectangle(img, (x_top_left, y_top_left), (x_top_left + width, y_top_left + height), BGR_color, thickness)
+
+    def write_label(self, img, face_location, predicted_label, kind):
+        top, right, bottom, left = face_location
+
+        # Add text to the image
+        text = predicted_label
+
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_BGR_color = (255, 255, 255)
+
+        if kind == 'emotion':
+            font_scale = 2
+            font_thickness = 3
+        else:
+            font_scale = 1
+            font_thickness = 2
+
+        # Calculate text size
+        text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
+        # Calculate rectangle dimensions based on text size
+        rect_width = text_size[0] + 10  # Add some padding
+        rect_height = text_size[1] + 10  # Add some padding
+
+        if kind == 'emotion':
+            rect_BGR_color = (0, 255, 0)
+            rect_top_left = (left, top - rect_height)
+            rect_bottom_right = (left + rect_width, top)
+            text_position = (left, top - 10)
+
+        elif kind == 'gender':
+            rect_BGR_color = (0, 0, 255)
+            rect_top_left = ((left + right - rect_width) // 2, bottom)
+            rect_bottom_right = ((left + right + rect_width) // 2, bottom + rect_height)
+            text_position = (rect_top_left[0], bottom + rect_height - 5)
+
+        elif kind == 'age':
+            rect_BGR_color = (128, 0, 128)
+            rect_top_left = ((left + right - rect_width) // 2, bottom + rect_height)
+            rect_bottom_right = ((left + right + rect_width) // 2, bottom + rect_height * 2)
+            text_position = (rect_top_left[0], bottom + rect_height * 2 - 5)
+
+
+        # Draw a rectangle
+        cv2.rectangle(img, rect_top_left, rect_bottom_right, rect_BGR_color, -1)
+
+        cv2.putText(img, text, text_position, font, font_scale, font_BGR_color, font_thickness)
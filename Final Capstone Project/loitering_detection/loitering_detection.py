@@ -1,3 +1,4 @@
+import time
 import cv2
 from ultralytics import YOLO
 from loitering_detection_helper import Detector
@@ -16,6 +17,7 @@ yolo_threshold = 0.5
 output_video_path = f'loitering_detection_' + str(src.replace('/', '_')) + '.mp4'
 fps_tracking = 5
 frs_skip = 5
+max_reconnect_backoff = 30  # seconds, live camera only
 # ----------------- END OF Configs -----------------
 
 
@@ -86,11 +88,20 @@ if src_type is str:
 
 
 elif src_type is int:
+    reconnect_backoff = 0
     while True:
         ret, frame = cap.read()
         if not ret:
+            # Camera dropped: reopen with exponential backoff instead of spinning on cap.read()
+            reconnect_backoff = min(reconnect_backoff * 2, max_reconnect_backoff) if reconnect_backoff else 0.5
+            print(f'Camera {src} returned no frame, reconnecting in {reconnect_backoff}s...')
+            time.sleep(reconnect_backoff)
+            cap.release()
+            cap = cv2.VideoCapture(src)
             continue
 
+        reconnect_backoff = 0
+
         fr_count += 1
 
         skip_fr = False
@@ -1,9 +1,19 @@
 from ultralytics import YOLO
 import cv2
+import numpy as np
 from collections import OrderedDict
 import math
+import os
+import sys
 import time
 
+try:
+    from capstone.resolution import ResolutionController
+except ImportError:
+    # Run as a script from its own directory: make `Final Capstone Project` importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from capstone.resolution import ResolutionController
+
 
 class LimitedDict(OrderedDict):
     def __init__(self, max_size):
@@ -20,11 +30,14 @@ class LimitedDict(OrderedDict):
 
 class Tracker:
     def __init__(self, yolo_model_path, threshold = 0.25, max_object_tracking = 1000,
-                 max_movement_history = 120) -> None:
-        self.yolo_model = YOLO(yolo_model_path)
+                 max_movement_history = 120, yolo_model = None, resolution_controller = None, imgsz = None) -> None:
+        # yolo_model: an already loaded (e.g. cached / exported) model, skips loading from yolo_model_path
+        self.yolo_model = yolo_model if yolo_model is not None else YOLO(yolo_model_path)
         self.threshold = threshold
         self.movement_history = LimitedDict(max_size=max_object_tracking)
         self.max_movement_history = max_movement_history
+        self.imgsz = imgsz  # fixed inference size, None --> model default
+        self.resolution_controller = resolution_controller  # overrides imgsz frame by frame
         self.start_time = LimitedDict(max_size=max_object_tracking)
 
     def get_current_objects(self, yolo_results, object_class = 0):
@@ -60,10 +73,30 @@ class Tracker:
             
         return current_objects
     
+    def inference_args(self, imgsz = None):
+        imgsz = imgsz or self.imgsz
+        return {'imgsz': imgsz} if imgsz else {}
+
+    def warmup(self, width = 1280, height = 720, imgsz = None):
+        # Run one inference on a blank frame so the first real frame does not pay the setup cost.
+        # predict() is used instead of track() to keep the tracker state clean.
+        blank = np.zeros((height, width, 3), dtype=np.uint8)
+        self.yolo_model.predict(blank, verbose=False, **self.inference_args(imgsz))
+
     def track(self, frame):
-        yolo_results = self.yolo_model.track(frame, persist=True, verbose = False)
+        if self.resolution_controller is None:
+            yolo_results = self.yolo_model.track(frame, persist=True, verbose = False, **self.inference_args())
+            return self.get_current_objects(yolo_results=yolo_results, object_class=0)
+
+        imgsz = self.resolution_controller.next_imgsz()
+        start = time.perf_counter()
+        yolo_results = self.yolo_model.track(frame, persist=True, verbose = False, imgsz=imgsz)
+        latency = time.perf_counter() - start
         current_people = self.get_current_objects(yolo_results=yolo_results, object_class=0)
 
+        self.resolution_controller.update(boxes=[person["bbox"] for person in current_people.values()],
+                                          frame_shape=frame.shape, imgsz=imgsz, latency=latency)
+
         return current_people
 
 
@@ -71,8 +104,10 @@ class Tracker:
 class Detector:
     def __init__(self, yolo_model_path, max_time = 60, min_movement = 300,
                  fps_tracking = 2,
-                 yolo_threshold = 0.25, max_object_tracking = 1000) -> None:
-        self.tracker = Tracker(yolo_model_path=yolo_model_path, threshold=yolo_threshold, max_object_tracking=max_object_tracking, max_movement_history=fps_tracking * max_time)
+                 yolo_threshold = 0.25, max_object_tracking = 1000, yolo_model = None,
+                 resolution_controller = None, imgsz = None) -> None:
+        self.tracker = Tracker(yolo_model_path=yolo_model_path, threshold=yolo_threshold, max_object_tracking=max_object_tracking, max_movement_history=fps_tracking * max_time,
+                               yolo_model=yolo_model, resolution_controller=resolution_controller, imgsz=imgsz)
         self.max_time = max_time
         self.min_movement = min_movement
 
@@ -0,0 +1,172 @@
+"""High-throughput scoring of marketplace reviews with the Tiki sentiment model.
+
+The notebook's `predict(new_sample)` tokenizes, pads and calls `model.predict` for one comment.
+Here comments are streamed from a CSV / JSONL file in chunks, tokenized with a tokenizer loaded
+once, scored in large batches and written out chunk by chunk, so memory stays flat on big files.
+
+The tokenizer is saved from the notebook with:
+    with open('tokenizer.json', 'w', encoding='UTF-8') as file:
+        file.write(tokenizer.to_json())
+
+Example:
+    python batch_classifier.py --model tiki_model.keras --tokenizer tokenizer.json \
+        --input reviews.jsonl --output scores.csv
+    python batch_classifier.py --model tiki_model.keras --tokenizer tokenizer.json \
+        --input reviews.csv --benchmark 20000
+"""
+import argparse
+import csv
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import tokenizer_from_json
+
+
+# Same parameters as the notebook
+max_length = 120
+trunc_type = 'post'
+threshold = 0.5
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(tokenizer_path):
+    with open(tokenizer_path, 'r', encoding='UTF-8') as file:
+        return tokenizer_from_json(file.read())
+
+
+@lru_cache(maxsize=None)
+def load_model(model_path):
+    return tf.keras.models.load_model(model_path)
+
+
+def read_comments(input_path, text_column = 'comment', chunk_size = 50000):
+    """Yield DataFrame chunks of a .csv or .jsonl file; empty comments are dropped."""
+    if input_path.endswith('.jsonl') or input_path.endswith('.json'):
+        reader = pd.read_json(input_path, lines=True, chunksize=chunk_size)
+    else:
+        reader = pd.read_csv(input_path, chunksize=chunk_size)
+
+    for chunk in reader:
+        chunk = chunk[chunk[text_column].notnull() & (chunk[text_column] != '')]
+        if len(chunk):
+            yield chunk
+
+
+class BatchClassifier:
+    def __init__(self, model, tokenizer, batch_size = 4096):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        # Embedding + Flatten fixes the input length; only variable-length models can use shorter buckets
+        self.fixed_length = model.input_shape[1]
+
+    def score(self, texts):
+        """Positive probability for every text, in input order."""
+        sequences = self.tokenizer.texts_to_sequences(list(texts))
+        scores = np.empty(len(sequences), dtype=np.float32)
+
+        if self.fixed_length is not None:
+            padded = pad_sequences(sequences, maxlen=self.fixed_length, truncating=trunc_type)
+            for start in range(0, len(padded), self.batch_size):
+                batch = padded[start : start + self.batch_size]
+                scores[start : start + len(batch)] = self.model.predict_on_batch(batch)[:, 0]
+            return scores
+
+        # Group by length so each batch is only padded to its own longest sequence
+        lengths = np.minimum([len(sequence) for sequence in sequences], max_length)
+        order = np.argsort(lengths, kind='stable')
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start : start + self.batch_size]
+            batch_length = max(int(lengths[rows].max()), 1)
+            batch = pad_sequences([sequences[row] for row in rows], maxlen=batch_length, truncating=trunc_type)
+            scores[rows] = self.model.predict_on_batch(batch)[:, 0]
+        return scores
+
+    def score_file(self, input_path, output_path, text_column = 'comment', id_column = None, chunk_size = 50000):
+        """Score a whole file chunk by chunk, appending results to `output_path`. Returns the number of records."""
+        total = 0
+        with open(output_path, 'w', encoding='UTF-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([id_column or 'row', 'score', 'label'])
+
+            for chunk in read_comments(input_path, text_column=text_column, chunk_size=chunk_size):
+                scores = self.score(chunk[text_column].astype(str))
+                ids = chunk[id_column] if id_column else chunk.index
+                labels = np.where(scores > threshold, 'Positive', 'Negative')
+                writer.writerows(zip(ids, np.round(scores, 6), labels))
+                file.flush()
+                total += len(chunk)
+
+        return total
+
+
+def predict(model, tokenizer, new_sample):
+    """The notebook's one-comment `predict`, kept as the benchmark baseline."""
+    sequences = tokenizer.texts_to_sequences([new_sample])
+    padded = pad_sequences(sequences, maxlen=max_length, truncating=trunc_type)
+    results = model.predict(padded, verbose=0)
+    result = results[0][0]
+    if result > threshold:
+        return 'Positive'
+
+    return 'Negative'
+
+
+def benchmark(classifier, texts, baseline_records = 200):
+    texts = list(texts)
+    classifier.score(texts[: classifier.batch_size])  # warm-up
+
+    start = time.perf_counter()
+    classifier.score(texts)
+    batch_seconds = time.perf_counter() - start
+
+    sample = texts[:baseline_records]
+    start = time.perf_counter()
+    for text in sample:
+        predict(classifier.model, classifier.tokenizer, text)
+    baseline_seconds = time.perf_counter() - start
+
+    results = {
+        'records': len(texts),
+        'batch_records_per_sec': len(texts) / batch_seconds,
+        'per_comment_records_per_sec': len(sample) / baseline_seconds,
+    }
+    results['speedup'] = results['batch_records_per_sec'] / results['per_comment_records_per_sec']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch sentiment scoring for Tiki reviews')
+    parser.add_argument('--model', required=True, help='model saved with model.save(...)')
+    parser.add_argument('--tokenizer', required=True, help='tokenizer saved with tokenizer.to_json()')
+    parser.add_argument('--input', required=True, help='.csv or .jsonl file')
+    parser.add_argument('--output', default='scores.csv')
+    parser.add_argument('--text-column', default='comment')
+    parser.add_argument('--id-column', default=None)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--benchmark', type=int, default=0, help='benchmark on the first N records instead of scoring')
+    args = parser.parse_args()
+
+    classifier = BatchClassifier(load_model(args.model), load_tokenizer(args.tokenizer), batch_size=args.batch_size)
+
+    if args.benchmark:
+        texts = next(read_comments(args.input, text_column=args.text_column, chunk_size=args.benchmark))[args.text_column].astype(str)
+        for name, value in benchmark(classifier, texts).items():
+            print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+        return
+
+    start = time.perf_counter()
+    total = classifier.score_file(args.input, args.output, text_column=args.text_column,
+                                  id_column=args.id_column, chunk_size=args.chunk_size)
+    seconds = time.perf_counter() - start
+    print(f'{total} records -> {os.path.abspath(args.output)} ({total / max(seconds, 1e-9):.0f} records/sec)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Binary, memory-mapped store for the Tiki classifier word embeddings, with top-k cosine search.
+
+vecs.tsv / meta.tsv (the Embedding Projector export of the notebook's Embedding layer) are
+converted once into:
+    embeddings.npy   float32 (vocab x dim), rows L2-normalized, memory-mapped on load
+    norms.npy        float32 (vocab,), original row norms (raw vector = row * norm)
+    vocab.json       the words, row order of meta.tsv
+    ivf.npz          optional approximate index (see IVFIndex)
+
+Example:
+    python embedding_store.py convert --vecs vecs.tsv --meta meta.tsv --store tiki_embeddings
+    python embedding_store.py query --store tiki_embeddings giao hàng nhanh -k 5
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+NORMS_FILE = 'norms.npy'
+VOCAB_FILE = 'vocab.json'
+IVF_FILE = 'ivf.npz'
+
+
+def convert_tsv(vecs_path, meta_path, store_dir):
+    vectors = np.loadtxt(vecs_path, delimiter='\t', dtype=np.float32, ndmin=2)
+    with open(meta_path, 'r', encoding='UTF-8') as file:
+        words = [line.rstrip('\n') for line in file]
+    if len(words) != len(vectors):
+        raise ValueError(f'{meta_path} has {len(words)} words but {vecs_path} has {len(vectors)} vectors')
+
+    norms = np.linalg.norm(vectors, axis=1)
+    normalized = vectors / np.maximum(norms, 1e-12)[:, np.newaxis]
+
+    os.makedirs(store_dir, exist_ok=True)
+    # An index built for the previous embeddings would point at the wrong rows
+    if os.path.exists(os.path.join(store_dir, IVF_FILE)):
+        os.remove(os.path.join(store_dir, IVF_FILE))
+    np.save(os.path.join(store_dir, EMBEDDINGS_FILE), normalized.astype(np.float32))
+    np.save(os.path.join(store_dir, NORMS_FILE), norms.astype(np.float32))
+    with open(os.path.join(store_dir, VOCAB_FILE), 'w', encoding='UTF-8') as file:
+        json.dump(words, file, ensure_ascii=False)
+
+    return EmbeddingStore(store_dir)
+
+
+def top_k(scores, k):
+    """Indices and scores of the k largest values of each row, best first."""
+    k = min(k, scores.shape[1])
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        self.norms = np.load(os.path.join(store_dir, NORMS_FILE), mmap_mode='r')
+        with open(os.path.join(store_dir, VOCAB_FILE), 'r', encoding='UTF-8') as file:
+            self.words = json.load(file)
+        self.index = {word: row for row, word in enumerate(self.words)}
+
+        self.ivf = None
+        if os.path.exists(os.path.join(store_dir, IVF_FILE)):
+            ivf = IVFIndex.load(os.path.join(store_dir, IVF_FILE))
+            if len(ivf.order) == len(self.words):  # ignore an index left from other embeddings
+                self.ivf = ivf
+
+    def __len__(self):
+        return len(self.words)
+
+    def row(self, word):
+        # The word as given first (e.g. '<OOV>'), then lowercased like the Tokenizer does
+        row = self.index.get(word)
+        return self.index.get(word.lower()) if row is None else row
+
+    def __contains__(self, word):
+        return self.row(word) is not None
+
+    def vector(self, word, normalized = False):
+        row = self.row(word)
+        if row is None:
+            raise KeyError(word)
+        return self.embeddings[row] if normalized else self.embeddings[row] * self.norms[row]
+
+    def build_ivf(self, num_lists = None, iterations = 10, seed = 42):
+        """Build and save the approximate index; only worth it for large vocabularies."""
+        self.ivf = IVFIndex.train(np.asarray(self.embeddings), num_lists=num_lists, iterations=iterations, seed=seed)
+        self.ivf.save(os.path.join(self.store_dir, IVF_FILE))
+        return self.ivf
+
+    def search(self, vectors, k = 10, approximate = False, num_probes = 8):
+        """Top-k cosine similarity for a batch of query vectors: (indices, scores), both (queries x k)."""
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        if approximate:
+            if self.ivf is None:
+                raise ValueError('No approximate index: call build_ivf() first')
+            return self.ivf.search(self.embeddings, queries, k=k, num_probes=num_probes)
+
+        return top_k(queries @ self.embeddings.T, k)
+
+    def most_similar(self, words, k = 10, approximate = False, num_probes = 8):
+        """Nearest words for each query word (the word itself excluded). Unknown words give []."""
+        single = isinstance(words, str)
+        words = [words] if single else list(words)
+        rows = [self.row(word) for word in words]
+        known = [row for row in rows if row is not None]
+
+        results = {}
+        if known:
+            indices, scores = self.search(self.embeddings[known], k=k + 1, approximate=approximate, num_probes=num_probes)
+            for row, row_indices, row_scores in zip(known, indices, scores):
+                results[row] = [
+                    (self.words[index], float(score))
+                    for index, score in zip(row_indices, row_scores)
+                    if index != row and index >= 0
+                ][:k]
+
+        output = [results.get(row, []) if row is not None else [] for row in rows]
+        return output[0] if single else output
+
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means lists, only the closest `num_probes` lists are scanned."""
+
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids  # (num_lists, dim), unit length
+        self.order = order  # store rows sorted by list
+        self.offsets = offsets  # list i = order[offsets[i]:offsets[i + 1]]
+
+    @classmethod
+    def train(cls, embeddings, num_lists = None, iterations = 10, seed = 42):
+        num_rows = len(embeddings)
+        num_lists = num_lists or max(1, int(np.sqrt(num_rows)))
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(num_rows, size=num_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = (embeddings @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, embeddings)
+            empty = ~np.bincount(assignments, minlength=num_lists).astype(bool)
+            sums[empty] = centroids[empty]  # keep empty lists where they are
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        assignments = (embeddings @ centroids.T).argmax(axis=1)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=num_lists))])
+        return cls(centroids.astype(np.float32), order, offsets)
+
+    def search(self, embeddings, queries, k = 10, num_probes = 8):
+        num_probes = min(num_probes, len(self.centroids))
+        probes, _ = top_k(queries @ self.centroids.T, num_probes)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, (query, query_probes) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in query_probes])
+            if not len(candidates):
+                continue
+            candidates.sort()  # forward reads through the memory map
+            candidate_indices, candidate_scores = top_k((embeddings[candidates] @ query)[np.newaxis, :], k)
+            found = candidate_indices.shape[1]
+            indices[i, :found] = candidates[candidate_indices[0]]
+            scores[i, :found] = candidate_scores[0]
+        return indices, scores
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['centroids'], data['order'], data['offsets'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiki embedding store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='vecs.tsv + meta.tsv -> binary store')
+    convert_parser.add_argument('--vecs', default='vecs.tsv')
+    convert_parser.add_argument('--meta', default='meta.tsv')
+    convert_parser.add_argument('--store', required=True)
+    convert_parser.add_argument('--ivf', action='store_true', help='also build the approximate index')
+
+    query_parser = subparsers.add_parser('query', help='nearest words')
+    query_parser.add_argument('--store', required=True)
+    query_parser.add_argument('words', nargs='+')
+    query_parser.add_argument('-k', type=int, default=10)
+    query_parser.add_argument('--approximate', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        store = convert_tsv(args.vecs, args.meta, args.store)
+        if args.ivf:
+            store.build_ivf()
+        print(f'{len(store)} words x {store.embeddings.shape[1]} dims -> {args.store}')
+        return
+
+    store = EmbeddingStore(args.store)
+    for word, neighbours in zip(args.words, store.most_similar(args.words, k=args.k, approximate=args.approximate)):
+        print(word, ':', ', '.join(f'{neighbour} ({score:.3f})' for neighbour, score in neighbours))
+
+
+if __name__ == '__main__':
+    main()
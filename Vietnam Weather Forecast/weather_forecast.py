@@ -0,0 +1,228 @@
+"""Nightly multivariate weather forecasts for every province in one pass.
+
+`windowed_dataset` / `model_forecast` in Vietnam_Weather_Forecast_multivariates_time_series.ipynb
+build windows with tf.data `window` / `flat_map` for one station series at a time. Here all
+stations are stacked into a (stations x time x features) array, windows are NumPy strided views
+over it (no copy), and the model is called once for every station.
+
+Example:
+    python weather_forecast.py --csv weather.csv --output forecast.csv
+    python weather_forecast.py --csv weather.csv --benchmark
+"""
+import argparse
+import os
+import pickle
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+
+
+FEATURES = ['max', 'min', 'wind', 'wind_d', 'rain', 'humidi', 'cloud', 'pressure']
+WINDOW_SIZE = 30
+
+MODEL_SCALED_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_scaled_data')
+MODEL_DIR = os.path.join(MODEL_SCALED_DATA_DIR, 'content', 'saved_model', 'model')
+SCALERS_FILE = os.path.join(MODEL_SCALED_DATA_DIR, 'scalers.pkl')
+
+
+# ----------------- Data -----------------
+
+def load_stations(csv_path):
+    """Read weather.csv into a stacked (stations x time x features) float32 array.
+
+    Returns (provinces, dates, series, wind_d_encoder). Stations are aligned on the dates they all share.
+    """
+    weather_df = pd.read_csv(csv_path)
+
+    encoder = LabelEncoder()
+    weather_df['wind_d'] = encoder.fit_transform(weather_df['wind_d'])
+
+    weather_df = weather_df.sort_values(['province', 'date'])
+    provinces = sorted(weather_df['province'].unique())
+    common_dates = None
+    for _, province_df in weather_df.groupby('province'):
+        dates = set(province_df['date'])
+        common_dates = dates if common_dates is None else common_dates & dates
+    dates = sorted(common_dates)
+
+    weather_df = weather_df[weather_df['date'].isin(common_dates)]
+    weather_df = weather_df.drop_duplicates(['province', 'date'])
+    series = weather_df[FEATURES].to_numpy(dtype=np.float32).reshape(len(provinces), len(dates), len(FEATURES))
+
+    return provinces, dates, series, encoder
+
+
+class StationScalers:
+    """One MinMaxScaler per province (as in the notebook), applied to all stations at once."""
+
+    def __init__(self, provinces, scalers, wind_d_encoder):
+        self.provinces = list(provinces)
+        self.scalers = scalers
+        self.wind_d_encoder = wind_d_encoder
+        self.scale = np.stack([scalers[province].scale_ for province in self.provinces]).astype(np.float32)[:, np.newaxis, :]
+        self.min = np.stack([scalers[province].min_ for province in self.provinces]).astype(np.float32)[:, np.newaxis, :]
+
+    @classmethod
+    def fit(cls, provinces, series, wind_d_encoder):
+        scalers = {}
+        for province, station_series in zip(provinces, series):
+            scalers[province] = MinMaxScaler(feature_range=(0, 1)).fit(station_series)
+        return cls(provinces, scalers, wind_d_encoder)
+
+    def transform(self, series):
+        # series: (stations, time, features)
+        return series * self.scale + self.min
+
+    def inverse_transform(self, scaled):
+        # scaled: (stations, ..., features)
+        shape = (len(self.provinces),) + (1,) * (scaled.ndim - 2) + (scaled.shape[-1],)
+        return (scaled - self.min.reshape(shape)) / self.scale.reshape(shape)
+
+    def decode_wind_d(self, values):
+        codes = np.clip(np.round(values), 0, len(self.wind_d_encoder.classes_) - 1).astype(int)
+        return self.wind_d_encoder.inverse_transform(codes.ravel()).reshape(codes.shape)
+
+
+def load_scalers(provinces, series, wind_d_encoder, scalers_file = SCALERS_FILE):
+    """Fit the per-province scalers once and reuse them from `scalers_file` afterwards."""
+    if os.path.exists(scalers_file):
+        with open(scalers_file, 'rb') as file:
+            cached = pickle.load(file)
+        if set(provinces) <= set(cached['scalers']):
+            return StationScalers(provinces, cached['scalers'], cached['wind_d_encoder'])
+
+    scalers = StationScalers.fit(provinces, series, wind_d_encoder)
+    # Plain sklearn objects only, so the file loads from scripts and notebooks alike
+    with open(scalers_file, 'wb') as file:
+        pickle.dump({'scalers': scalers.scalers, 'wind_d_encoder': scalers.wind_d_encoder}, file)
+    return scalers
+
+
+@lru_cache(maxsize=None)
+def load_model(model_dir = MODEL_DIR):
+    return tf.keras.models.load_model(model_dir)
+
+
+# ----------------- Windows -----------------
+
+def sliding_windows(series, window_size = WINDOW_SIZE):
+    """Zero-copy (stations, num_windows, window_size, features) view over (stations, time, features)."""
+    windows = np.lib.stride_tricks.sliding_window_view(series, window_size, axis=-2)
+    # sliding_window_view puts the window axis last: move it before the features (still a view)
+    return np.moveaxis(windows, -1, -2)
+
+
+def windowed_arrays(series, window_size = WINDOW_SIZE):
+    """Training pairs like the notebook's `windowed_dataset`: X = window, y = the next step."""
+    X = sliding_windows(series[:, :-1], window_size)
+    y = series[:, window_size:]
+    return X, y
+
+
+# ----------------- Forecast -----------------
+
+def model_forecast(model, series, window_size = WINDOW_SIZE, batch_size = 4096):
+    """Vectorized `model_forecast` over every window of every station: (stations, num_windows, features).
+
+    `windows` stays a strided view; reshaping it to (stations * num_windows, ...) would silently copy
+    every window. Instead, batches run over the flattened station x window index: windows are copied
+    into one preallocated contiguous (batch_size, window_size, features) buffer that fills across
+    station boundaries, which is the only copy, and the forecasts are scattered back per station.
+    """
+    windows = sliding_windows(series, window_size)
+    num_stations, num_windows = windows.shape[:2]
+    total = num_stations * num_windows
+    buffer = np.empty((min(batch_size, total), window_size, series.shape[-1]), dtype=series.dtype)
+
+    forecast = None
+    for start in range(0, total, batch_size):
+        stop = min(start + batch_size, total)
+        # Fill the buffer from consecutive (station, window) runs
+        position = start
+        while position < stop:
+            station, window = divmod(position, num_windows)
+            count = min(num_windows - window, stop - position)
+            buffer[position - start : position - start + count] = windows[station, window : window + count]
+            position += count
+
+        batch_forecast = np.asarray(model.predict_on_batch(buffer[: stop - start]))
+        if forecast is None:
+            forecast = np.empty((total, batch_forecast.shape[-1]), dtype=batch_forecast.dtype)
+        forecast[start:stop] = batch_forecast
+
+    # (stations * num_windows, features) is already in station-major order
+    return forecast.reshape(num_stations, num_windows, -1)
+
+
+def forecast_next_day(model, series, window_size = WINDOW_SIZE):
+    """Next-step forecast for every station in a single model call: (stations, features)."""
+    last_windows = np.ascontiguousarray(series[:, -window_size:, :])
+    return model(last_windows, training=False).numpy()
+
+
+def model_forecast_tf_data(model, series, window_size = WINDOW_SIZE):
+    """The notebook's tf.data path for one station, kept as the benchmark baseline."""
+    ds = tf.data.Dataset.from_tensor_slices(series)
+    ds = ds.window(window_size, shift=1, drop_remainder=True)
+    ds = ds.flat_map(lambda w: w.batch(window_size))
+    ds = ds.batch(32).prefetch(1)
+    forecast = model.predict(ds, verbose=0)
+    return forecast
+
+
+def benchmark(model, scaled_series, window_size = WINDOW_SIZE):
+    start = time.perf_counter()
+    for station_series in scaled_series:
+        model_forecast_tf_data(model, station_series, window_size)
+    tf_data_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model_forecast(model, scaled_series, window_size)
+    vectorized_seconds = time.perf_counter() - start
+
+    num_windows = scaled_series.shape[0] * (scaled_series.shape[1] - window_size + 1)
+    return {
+        'stations': scaled_series.shape[0],
+        'windows': num_windows,
+        'tf_data_seconds': tf_data_seconds,
+        'vectorized_seconds': vectorized_seconds,
+        'tf_data_windows_per_sec': num_windows / tf_data_seconds,
+        'vectorized_windows_per_sec': num_windows / vectorized_seconds,
+        'speedup': tf_data_seconds / vectorized_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Forecast the next day for every province')
+    parser.add_argument('--csv', required=True, help='weather.csv from the vietnam-weather-data dataset')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--scalers-file', default=SCALERS_FILE)
+    parser.add_argument('--output', default='forecast.csv')
+    parser.add_argument('--benchmark', action='store_true', help='compare against the per-station tf.data path')
+    args = parser.parse_args()
+
+    provinces, dates, series, encoder = load_stations(args.csv)
+    scalers = load_scalers(provinces, series, encoder, scalers_file=args.scalers_file)
+    scaled_series = scalers.transform(series)
+    model = load_model(args.model_dir)
+
+    if args.benchmark:
+        for name, value in benchmark(model, scaled_series).items():
+            print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+        return
+
+    forecast = scalers.inverse_transform(forecast_next_day(model, scaled_series))
+    forecast_df = pd.DataFrame(forecast, columns=FEATURES)
+    forecast_df['wind_d'] = scalers.decode_wind_d(forecast[:, FEATURES.index('wind_d')])
+    forecast_df.insert(0, 'province', provinces)
+    forecast_df.insert(1, 'after_date', dates[-1])
+    forecast_df.to_csv(args.output, index=False)
+    print(f'Forecast for {len(provinces)} provinces written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
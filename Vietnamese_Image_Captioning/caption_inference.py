@@ -0,0 +1,330 @@
+"""Fast caption generation for the Vietnamese image captioning model.
+
+The notebook's `generate_caption` re-vectorizes the growing caption string and re-runs the
+whole decoder over every prefix at each step, for one image at a time. Here decoding works on
+token ids, caches the self-attention keys / values of the tokens already generated (and the
+cross-attention keys / values of the encoded image), and decodes many images at once.
+Finished sequences leave the batch, so the remaining steps only pay for unfinished ones.
+
+The vocabulary comes from the training notebook: `save_vocabulary(vectorization, "vocabulary.json")`.
+
+Example:
+    python caption_inference.py --weights weights.h5 --vocabulary vocabulary.json \
+        --images /content/dataset/test/images --batch-size 64 --beam-width 3
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from caption_model import (
+    END_TOKEN,
+    SEQ_LENGTH,
+    START_TOKEN,
+    build_vectorization,
+    decode_and_resize,
+    load_caption_model,
+    load_vocabulary,
+)
+from feature_store import FeatureStore
+
+
+class IncrementalDecoder:
+    """Runs `TransformerDecoderBlock` one position at a time with cached attention state.
+
+    The block is a single layer, and everything after the causal self-attention is
+    position-wise, so the prediction for position t only needs the new token plus the
+    cached keys / values of positions < t. Results match the full decoder at inference
+    (training=False, dropout off).
+    """
+
+    def __init__(self, decoder, max_length=SEQ_LENGTH - 1):
+        self.decoder = decoder
+        self.max_length = max_length
+        self._step = tf.function(self._step_fn, reduce_retracing=True)
+
+    def init_state(self, encoded_images):
+        attention_2 = self.decoder.attention_2
+        batch_size = tf.shape(encoded_images)[0]
+        cross_key = attention_2._key_dense(encoded_images)
+        cross_value = attention_2._value_dense(encoded_images)
+        num_heads, head_dim = cross_key.shape[-2], cross_key.shape[-1]
+        self_key = tf.zeros((batch_size, self.max_length, num_heads, head_dim), dtype=cross_key.dtype)
+        self_value = tf.zeros_like(self_key)
+        return {
+            "cross_key": cross_key,
+            "cross_value": cross_value,
+            "self_key": self_key,
+            "self_value": self_value,
+        }
+
+    @staticmethod
+    def gather_state(state, indices):
+        return {name: tf.gather(value, indices) for name, value in state.items()}
+
+    def step(self, tokens, position, state):
+        """Return (probabilities over the vocabulary for `position`, updated state)."""
+        return self._step(
+            tf.convert_to_tensor(tokens, dtype=tf.int64),
+            tf.constant(position, dtype=tf.int32),
+            state,
+        )
+
+    def _attend(self, attention, query, key, value, key_mask=None):
+        query = attention._query_dense(query)
+        query = query * tf.math.rsqrt(tf.cast(tf.shape(query)[-1], query.dtype))
+        scores = tf.einsum("bqhd,bkhd->bhqk", query, key)
+        if key_mask is not None:
+            scores = tf.where(key_mask[tf.newaxis, tf.newaxis, tf.newaxis, :], scores, -1e9)
+        weights = tf.nn.softmax(scores, axis=-1)
+        context = tf.einsum("bhqk,bkhd->bqhd", weights, value)
+        return attention._output_dense(context)
+
+    def _step_fn(self, tokens, position, state):
+        decoder = self.decoder
+        embedding = decoder.embedding
+
+        inputs = embedding.token_embeddings(tokens[:, tf.newaxis]) * embedding.embed_scale
+        inputs = inputs + embedding.position_embeddings(position)[tf.newaxis, tf.newaxis, :]
+
+        # Causal self-attention: write this position's key / value into the cache, attend to <= position
+        attention_1 = decoder.attention_1
+        slot = tf.one_hot(position, self.max_length, dtype=inputs.dtype)[tf.newaxis, :, tf.newaxis, tf.newaxis]
+        self_key = state["self_key"] + slot * attention_1._key_dense(inputs)
+        self_value = state["self_value"] + slot * attention_1._value_dense(inputs)
+        key_mask = tf.range(self.max_length) <= position
+        attention_output_1 = self._attend(attention_1, inputs, self_key, self_value, key_mask=key_mask)
+        out_1 = decoder.layernorm_1(inputs + attention_output_1)
+
+        # Cross-attention over the (pre-projected) encoder outputs
+        attention_output_2 = self._attend(decoder.attention_2, out_1, state["cross_key"], state["cross_value"])
+        out_2 = decoder.layernorm_2(out_1 + attention_output_2)
+
+        ffn_out = decoder.ffn_layer_1(out_2)
+        ffn_out = decoder.ffn_layer_2(ffn_out)
+        ffn_out = decoder.layernorm_3(ffn_out + out_2)
+        preds = decoder.out(ffn_out)[:, 0, :]
+
+        new_state = dict(state, self_key=self_key, self_value=self_value)
+        return preds, new_state
+
+
+class CaptionGenerator:
+    def __init__(self, caption_model, vocabulary, max_length=SEQ_LENGTH - 1):
+        self.caption_model = caption_model
+        self.vocabulary = list(vocabulary)
+        self.max_length = max_length
+        self.start_id = self.vocabulary.index(START_TOKEN)
+        self.end_id = self.vocabulary.index(END_TOKEN)
+        self.decoder = IncrementalDecoder(caption_model.decoder, max_length=max_length)
+
+    def encode_images(self, images):
+        img_embed = self.caption_model.cnn_model(images, training=False)
+        return self.caption_model.encoder(img_embed, training=False)
+
+    def tokens_to_caption(self, token_ids):
+        words = []
+        for token_id in token_ids:
+            token_id = int(token_id)
+            if token_id in (0, self.end_id):
+                break
+            words.append(self.vocabulary[token_id])
+        return " ".join(words)
+
+    def _next_token_log_probs(self, tokens, position, state):
+        probs, state = self.decoder.step(tokens, position, state)
+        log_probs = np.log(np.maximum(probs.numpy(), 1e-12))
+        # Padding is never a real token (the notebook's string loop silently drops it)
+        log_probs[:, 0] = -np.inf
+        return log_probs, state
+
+    def greedy_decode(self, encoded_images):
+        batch_size = int(encoded_images.shape[0])
+        outputs = np.zeros((batch_size, self.max_length), dtype=np.int64)
+        active = np.arange(batch_size)  # original rows still decoding
+        tokens = np.full(batch_size, self.start_id, dtype=np.int64)
+        state = self.decoder.init_state(encoded_images)
+
+        for position in range(self.max_length):
+            log_probs, state = self._next_token_log_probs(tokens, position, state)
+            tokens = log_probs.argmax(axis=-1)
+            outputs[active, position] = tokens
+
+            finished = tokens == self.end_id
+            if finished.any():
+                keep = np.flatnonzero(~finished)
+                if keep.size == 0:
+                    break
+                active, tokens = active[keep], tokens[keep]
+                state = IncrementalDecoder.gather_state(state, keep)
+
+        return [self.tokens_to_caption(row) for row in outputs]
+
+    def beam_search(self, encoded_images, beam_width=3, length_penalty=0.7):
+        batch_size = int(encoded_images.shape[0])
+        beam = beam_width
+        state = self.decoder.init_state(tf.repeat(encoded_images, beam, axis=0))
+
+        scores = np.full((batch_size, beam), -np.inf)
+        scores[:, 0] = 0.0  # all beams start identical: expand only the first one
+        sequences = np.zeros((batch_size, beam, self.max_length), dtype=np.int64)
+        finished = np.zeros((batch_size, beam), dtype=bool)
+        tokens = np.full(batch_size * beam, self.start_id, dtype=np.int64)
+        active = np.arange(batch_size)
+        captions = [None] * batch_size
+
+        for position in range(self.max_length):
+            log_probs, state = self._next_token_log_probs(tokens, position, state)
+            num_active = len(active)
+            log_probs = log_probs.reshape(num_active, beam, -1)
+            vocab_size = log_probs.shape[-1]
+
+            # Finished beams can only be carried over unchanged
+            rows, cols = np.nonzero(finished)
+            log_probs[rows, cols, :] = -np.inf
+            log_probs[rows, cols, self.end_id] = 0.0
+
+            candidates = (scores[:, :, np.newaxis] + log_probs).reshape(num_active, -1)
+            top = np.argpartition(-candidates, beam - 1, axis=1)[:, :beam]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(candidates, top, axis=1), axis=1), axis=1)
+
+            beam_index, tokens = top // vocab_size, top % vocab_size
+            image_index = np.arange(num_active)[:, np.newaxis]
+            scores = np.take_along_axis(candidates, top, axis=1)
+            sequences = sequences[image_index, beam_index]
+            sequences[:, :, position] = tokens
+            finished = finished[image_index, beam_index] | (tokens == self.end_id)
+            state = IncrementalDecoder.gather_state(state, (image_index * beam + beam_index).ravel())
+            tokens = tokens.ravel()
+
+            # Early stop per image: once all its beams are finished it leaves the batch
+            done = finished.all(axis=1) if position < self.max_length - 1 else np.ones(num_active, dtype=bool)
+            for i in np.flatnonzero(done):
+                lengths = np.array([self._length(seq) for seq in sequences[i]])
+                normalized = scores[i] / lengths ** length_penalty
+                captions[active[i]] = self.tokens_to_caption(sequences[i, normalized.argmax()])
+
+            if done.any():
+                keep = np.flatnonzero(~done)
+                if keep.size == 0:
+                    break
+                active, scores, sequences, finished = active[keep], scores[keep], sequences[keep], finished[keep]
+                tokens = tokens.reshape(num_active, beam)[keep].ravel()
+                state = IncrementalDecoder.gather_state(state, (keep[:, np.newaxis] * beam + np.arange(beam)).ravel())
+
+        return captions
+
+    def _length(self, sequence):
+        end = np.flatnonzero(sequence == self.end_id)
+        return (end[0] + 1) if end.size else len(sequence)
+
+    def caption_encoded(self, encoded_images, beam_width=1):
+        if beam_width <= 1:
+            return self.greedy_decode(encoded_images)
+        return self.beam_search(encoded_images, beam_width=beam_width)
+
+    def caption_images(self, image_paths, batch_size=64, beam_width=1):
+        dataset = tf.data.Dataset.from_tensor_slices(list(image_paths))
+        dataset = dataset.map(decode_and_resize, num_parallel_calls=tf.data.AUTOTUNE)
+        dataset = dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+        captions = []
+        for images in dataset:
+            captions += self.caption_encoded(self.encode_images(images), beam_width=beam_width)
+        return captions
+
+    def caption_store(self, store, image_paths, batch_size=64, beam_width=1):
+        """Caption images whose CNN features are in a `feature_store.FeatureStore`; no image is decoded."""
+        captions = []
+        for _, features in store.iter_batches(list(image_paths), batch_size=batch_size):
+            encoded = self.caption_model.encoder(tf.convert_to_tensor(features, dtype=tf.float32), training=False)
+            captions += self.caption_encoded(encoded, beam_width=beam_width)
+        return captions
+
+
+def generate_caption_reference(caption_model, vectorization, image_path, max_length=SEQ_LENGTH - 1):
+    """The notebook's per-image string loop, kept as the benchmark baseline."""
+    vocab = vectorization.get_vocabulary()
+    img = tf.expand_dims(decode_and_resize(image_path), 0)
+    encoded_img = caption_model.encoder(caption_model.cnn_model(img), training=False)
+
+    decoded_caption = START_TOKEN + " "
+    for i in range(max_length):
+        tokenized_caption = vectorization([decoded_caption])[:, :-1]
+        mask = tf.math.not_equal(tokenized_caption, 0)
+        predictions = caption_model.decoder(tokenized_caption, encoded_img, training=False, mask=mask)
+        sampled_token = vocab[np.argmax(predictions[0, i, :])]
+        if sampled_token == END_TOKEN:
+            break
+        decoded_caption += " " + sampled_token
+
+    return decoded_caption.replace(START_TOKEN + " ", "").strip()
+
+
+def benchmark(caption_model, vocabulary, image_paths, batch_size=64, beam_width=1, baseline_images=0):
+    generator = CaptionGenerator(caption_model, vocabulary)
+
+    # Warm-up: trace the decoding step once outside the timed region
+    generator.caption_images(image_paths[:batch_size], batch_size=batch_size, beam_width=beam_width)
+
+    start = time.perf_counter()
+    generator.caption_images(image_paths, batch_size=batch_size, beam_width=beam_width)
+    elapsed = time.perf_counter() - start
+    results = {"images": len(image_paths), "seconds": elapsed, "images_per_sec": len(image_paths) / elapsed}
+
+    if baseline_images:
+        vectorization = build_vectorization(vocabulary=vocabulary)
+        sample = image_paths[:baseline_images]
+        start = time.perf_counter()
+        for image_path in sample:
+            generate_caption_reference(caption_model, vectorization, image_path)
+        baseline_elapsed = time.perf_counter() - start
+        results["baseline_images_per_sec"] = len(sample) / baseline_elapsed
+        results["speedup"] = results["images_per_sec"] / results["baseline_images_per_sec"]
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched caption decoding and throughput benchmark")
+    parser.add_argument("--weights", required=True, help="weights saved with caption_model.save_weights")
+    parser.add_argument("--vocabulary", required=True, help="json saved with caption_model.save_vocabulary")
+    parser.add_argument("--images", required=True, help="image directory or glob pattern")
+    parser.add_argument("--feature-store", default=None, help="read CNN features from this store (see feature_store.py)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--beam-width", type=int, default=1)
+    parser.add_argument("--baseline-images", type=int, default=0,
+                        help="also time the notebook's per-image loop on this many images")
+    parser.add_argument("--output", default=None, help="write 'image_path<TAB>caption' lines instead of benchmarking")
+    args = parser.parse_args()
+
+    pattern = os.path.join(args.images, "*.jpg") if os.path.isdir(args.images) else args.images
+    image_paths = sorted(glob.glob(pattern))
+
+    caption_model = load_caption_model(args.weights)
+    vocabulary = load_vocabulary(args.vocabulary)
+
+    if args.output:
+        generator = CaptionGenerator(caption_model, vocabulary)
+        if args.feature_store:
+            store = FeatureStore(args.feature_store)
+            image_paths = [path for path in image_paths if path in store]
+            captions = generator.caption_store(store, image_paths, batch_size=args.batch_size, beam_width=args.beam_width)
+        else:
+            captions = generator.caption_images(image_paths, batch_size=args.batch_size, beam_width=args.beam_width)
+        with open(args.output, "w", encoding="UTF-8") as file:
+            for image_path, caption in zip(image_paths, captions):
+                file.write(f"{image_path}\t{caption}\n")
+        return
+
+    results = benchmark(caption_model, vocabulary, image_paths, batch_size=args.batch_size,
+                        beam_width=args.beam_width, baseline_images=args.baseline_images)
+    for name, value in results.items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
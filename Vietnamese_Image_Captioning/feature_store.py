@@ -0,0 +1,170 @@
+"""Precomputed CNN features for the captioning model.
+
+The EfficientNetB0 backbone is frozen, so its output for an image never changes. This module
+runs it once over the dataset in large batches and writes the features to a memory-mapped
+`features.npy` (rows in extraction order) next to an `index.json` mapping image path -> row.
+Training and inference then read features from the store instead of decoding, resizing and
+running the backbone every epoch.
+
+To train from the store, build the model with `ImageCaptioningModel(..., precomputed_features=True)`
+and pass `make_dataset(store, ...)` to `fit`. Image augmentation happens before the backbone,
+so it is not applied when training from the store.
+
+Example:
+    python feature_store.py --images /content/dataset/train/images --store train_features
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from caption_model import IMAGE_SIZE, decode_and_resize, get_cnn_model
+
+
+FEATURES_FILE = "features.npy"
+INDEX_FILE = "index.json"
+
+
+def extract_features(cnn_model, image_paths, store_dir, batch_size=256, dtype="float32"):
+    """Run the backbone once over `image_paths` and write the feature store to `store_dir`."""
+    image_paths = list(dict.fromkeys(image_paths))  # unique, order kept
+    os.makedirs(store_dir, exist_ok=True)
+
+    # Re-extracting into an existing store: drop the old index first, so a crash below leaves
+    # an incomplete store instead of the old index next to half-rewritten features
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    feature_shape = tuple(cnn_model.output_shape[1:])
+    features_path = os.path.join(store_dir, FEATURES_FILE)
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=dtype, shape=(len(image_paths), *feature_shape)
+    )
+
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(decode_and_resize, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    row = 0
+    for images in dataset:
+        batch_features = cnn_model(images, training=False).numpy()
+        features[row : row + len(batch_features)] = batch_features
+        row += len(batch_features)
+    features.flush()
+    del features
+
+    # The index is written last: a store without it is incomplete
+    with open(index_path, "w", encoding="UTF-8") as file:
+        json.dump(
+            {
+                "backbone": "efficientnetb0",
+                "image_size": list(IMAGE_SIZE),
+                "feature_shape": list(feature_shape),
+                "dtype": dtype,
+                "paths": image_paths,
+            },
+            file,
+            ensure_ascii=False,
+        )
+
+    return FeatureStore(store_dir)
+
+
+class FeatureStore:
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, INDEX_FILE), "r", encoding="UTF-8") as file:
+            meta = json.load(file)
+        self.meta = meta
+        self.paths = meta["paths"]
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        # Read-only memory map: nothing is loaded until it is sliced
+        self.features = np.load(os.path.join(store_dir, FEATURES_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, image_path):
+        return image_path in self.rows
+
+    def row_indices(self, image_paths):
+        return np.array([self.rows[path] for path in image_paths], dtype=np.int64)
+
+    def slice(self, start, stop):
+        """Zero-copy view over consecutive rows."""
+        return self.features[start:stop]
+
+    def get(self, image_paths):
+        """Features for `image_paths`; a view when they are consecutive rows of the store."""
+        rows = self.row_indices(image_paths)
+        if len(rows) and np.all(np.diff(rows) == 1):
+            return self.slice(rows[0], rows[-1] + 1)
+        return self.features[rows]
+
+    def iter_batches(self, image_paths, batch_size=256):
+        for start in range(0, len(image_paths), batch_size):
+            batch_paths = image_paths[start : start + batch_size]
+            yield batch_paths, self.get(batch_paths)
+
+
+def make_dataset(store, images, captions, vectorization, batch_size=64, shuffle=True):
+    """Drop-in replacement for the notebook's `make_dataset`: yields (features, tokenized captions).
+
+    Captions are vectorized once up front. Each batch reads its rows from the memory map in
+    ascending order, so the page cache is walked forward instead of randomly.
+    """
+    rows = store.row_indices(images)
+    captions_per_image = len(captions[0])
+    flat_captions = [caption for image_captions in captions for caption in image_captions]
+    tokens = vectorization(tf.constant(flat_captions)).numpy()
+    tokens = tokens.reshape(len(captions), captions_per_image, -1)  # (num_images, captions_per_image, SEQ_LENGTH)
+    features = store.features
+    feature_shape = features.shape[1:]
+
+    def load_batch(batch_positions):
+        batch_positions = np.sort(batch_positions)
+        return (
+            np.asarray(features[rows[batch_positions]], dtype=np.float32),
+            tokens[batch_positions],
+        )
+
+    dataset = tf.data.Dataset.range(len(rows))
+    if shuffle:
+        dataset = dataset.shuffle(len(rows), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(
+        lambda batch_positions: tf.numpy_function(
+            load_batch, [batch_positions], [tf.float32, tf.as_dtype(tokens.dtype)]
+        ),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    dataset = dataset.map(
+        lambda batch_features, batch_tokens: (
+            tf.ensure_shape(batch_features, (None, *feature_shape)),
+            tf.ensure_shape(batch_tokens, (None, *tokens.shape[1:])),
+        )
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the captioning CNN backbone once and store the features")
+    parser.add_argument("--images", required=True, help="image directory or glob pattern")
+    parser.add_argument("--store", required=True, help="output directory of the feature store")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"],
+                        help="float16 halves the disk size but slices are no longer zero-copy")
+    args = parser.parse_args()
+
+    pattern = os.path.join(args.images, "*.jpg") if os.path.isdir(args.images) else args.images
+    image_paths = sorted(glob.glob(pattern))
+
+    store = extract_features(get_cnn_model(), image_paths, args.store, batch_size=args.batch_size, dtype=args.dtype)
+    print(f"{len(store)} images -> {args.store} {store.features.shape} {store.features.dtype}")
+
+
+if __name__ == "__main__":
+    main()
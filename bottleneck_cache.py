@@ -0,0 +1,366 @@
+"""Bottleneck-feature cache for the transfer-learning classifiers.
+
+The VGG16 / InceptionV3 / ... backbones in Lab_2_Transfer_Learning_with_SOTA_models.ipynb and
+`covid classifiers using transfer learning vgg16` are frozen, yet `model.fit(train_generator)`
+runs every image through them on every epoch. This module runs the backbone once per image
+(plus an optional fixed number of augmentation draws), stores the features in memory-mapped
+shards keyed by image content hash and backbone, and trains the small heads from the cache.
+
+    cache = BottleneckCache('bottlenecks', VGG16(include_top=False, weights='imagenet',
+                                                 input_shape=(150, 150, 3)), layer_name='block5_pool')
+    paths, labels, class_indices = images_from_directory('train')
+    augmenter = ImageDataGenerator(rotation_range=40, horizontal_flip=True)
+    cache.build(paths, augmenter=augmenter, augment_draws=4)
+
+    head = build_head(cache.feature_shape, num_classes=len(class_indices))
+    head.compile(...)
+    head.fit(FeatureSequence(cache, paths, labels, num_classes=len(class_indices), augmenter=augmenter), epochs=20)
+
+    model = attach_head(cache.feature_model, head)  # full image -> prediction model
+
+Relabelling only changes `labels`: the features are found again by image hash, so only the
+head is retrained.
+
+Example:
+    python bottleneck_cache.py --train-dir train --backbone vgg16 --layer block5_pool --augment-draws 4 --epochs 20
+    python bottleneck_cache.py --train-dir train --backbone vgg16 --layer block5_pool --benchmark
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from tensorflow.keras.models import Model
+
+from image_shards import images_from_directory
+
+
+INDEX_FILE = 'index.json'
+
+
+def file_hash(path, chunk_size = 1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def weights_fingerprint(model):
+    sha1 = hashlib.sha1()
+    for weight in model.weights:
+        sha1.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return sha1.hexdigest()[:12]
+
+
+def augmenter_fingerprint(augmenter):
+    """Short hash of an ImageDataGenerator's settings: changed augmentation means new cache keys."""
+    config = {}
+    for name, value in sorted(vars(augmenter).items()):
+        if callable(value):
+            value = getattr(value, '__qualname__', type(value).__name__)
+        elif isinstance(value, np.ndarray):
+            value = value.tolist()
+        config[name] = value
+    return hashlib.sha1(repr(config).encode()).hexdigest()[:12]
+
+
+class BottleneckCache:
+    def __init__(self, cache_dir, backbone, layer_name = None, rescale = 1./255,
+                 shard_size = 2048, dtype = 'float32'):
+        if layer_name is not None:
+            self.feature_model = Model(inputs=backbone.input, outputs=backbone.get_layer(layer_name).output)
+        else:
+            self.feature_model = backbone
+        self.feature_model.trainable = False
+
+        self.image_size = tuple(backbone.input_shape[1:3])
+        self.feature_shape = tuple(self.feature_model.output_shape[1:])
+        self.rescale = rescale
+        self.shard_size = shard_size
+        self.dtype = dtype
+
+        # Features only stay valid for the same backbone, cut layer, weights, input size and scaling
+        backbone_key = '{}-{}-{}x{}-{}-{}'.format(backbone.name, layer_name or 'output', *self.image_size,
+                                                  rescale, weights_fingerprint(self.feature_model))
+        self.cache_dir = os.path.join(cache_dir, backbone_key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        else:
+            index = {'entries': {}, 'shard_rows': []}
+        # '<image hash>:0' (not augmented) or '<image hash>:<augmenter fingerprint>:<draw>' -> [shard, row]
+        self.entries = index['entries']
+        self.shard_rows = index['shard_rows']  # filled rows per shard
+        self.shards = {}
+        self.path_hashes = {}
+
+    # ----------------- build -----------------
+
+    def image_key(self, path):
+        if path not in self.path_hashes:
+            self.path_hashes[path] = file_hash(path)
+        return self.path_hashes[path]
+
+    def entry_key(self, path, draw = 0, augmenter = None):
+        if draw == 0:
+            return f'{self.image_key(path)}:0'
+        return f'{self.image_key(path)}:{augmenter_fingerprint(augmenter)}:{draw}'
+
+    def load_image(self, path):
+        img = tf.keras.utils.load_img(path, target_size=self.image_size)
+        return tf.keras.utils.img_to_array(img)
+
+    def build(self, image_paths, augmenter = None, augment_draws = 0, batch_size = 64):
+        """Compute the missing features of `image_paths` (and `augment_draws` augmented copies of each).
+
+        `augmenter` is an ImageDataGenerator. Draw d of an image always uses the same random
+        transform, and augmented keys include the augmenter's settings, so changing them
+        computes new entries instead of reusing the old ones.
+        """
+        pending, seen = [], set()
+        for path in image_paths:
+            for draw in range(augment_draws + 1 if augmenter is not None else 1):
+                key = self.entry_key(path, draw, augmenter)
+                if key not in self.entries and key not in seen:  # duplicate files are computed once
+                    seen.add(key)
+                    pending.append((path, draw, key))
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start : start + batch_size]
+            images = []
+            for path, draw, key in batch:
+                img = self.load_image(path)
+                if draw > 0:
+                    seed = int(self.image_key(path)[:8], 16) + draw
+                    img = augmenter.random_transform(img, seed=seed)
+                images.append(img * self.rescale)
+            features = self.feature_model.predict_on_batch(np.stack(images))
+            for (path, draw, key), feature in zip(batch, features):
+                self._append(key, feature)
+            self._save_index()
+
+        return len(pending)
+
+    def _append(self, key, feature):
+        if not self.shard_rows or self.shard_rows[-1] >= self.shard_size:
+            shard_id = len(self.shard_rows)
+            np.lib.format.open_memmap(self._shard_path(shard_id), mode='w+', dtype=self.dtype,
+                                      shape=(self.shard_size, *self.feature_shape))
+            self.shard_rows.append(0)
+        shard_id = len(self.shard_rows) - 1
+        row = self.shard_rows[shard_id]
+        self._shard(shard_id, writable=True)[row] = feature
+        self.shard_rows[shard_id] += 1
+        self.entries[key] = [shard_id, row]
+
+    def _save_index(self):
+        for shard in self.shards.values():
+            if isinstance(shard, np.memmap):
+                shard.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'entries': self.entries, 'shard_rows': self.shard_rows}, file)
+        os.replace(tmp_path, self.index_path)
+
+    # ----------------- read -----------------
+
+    def _shard_path(self, shard_id):
+        return os.path.join(self.cache_dir, f'shard_{shard_id:05d}.npy')
+
+    def _shard(self, shard_id, writable = False):
+        shard = self.shards.get(shard_id)
+        if shard is None or (writable and not shard.flags.writeable):
+            shard = np.load(self._shard_path(shard_id), mmap_mode='r+' if writable else 'r')
+            self.shards[shard_id] = shard
+        return shard
+
+    def available_keys(self, path, augmenter = None):
+        """Cached keys of an image: the plain features, then the draws made with `augmenter`."""
+        keys = []
+        draw = 0
+        while self.entry_key(path, draw, augmenter) in self.entries:
+            keys.append(self.entry_key(path, draw, augmenter))
+            if augmenter is None:
+                break
+            draw += 1
+        return keys
+
+    def get(self, keys):
+        """Features for cache keys, read shard by shard in row order."""
+        locations = np.array([self.entries[key] for key in keys])
+        features = np.empty((len(keys), *self.feature_shape), dtype=np.float32)
+        for shard_id in np.unique(locations[:, 0]):
+            positions = np.flatnonzero(locations[:, 0] == shard_id)
+            rows = locations[positions, 1]
+            order = np.argsort(rows)
+            features[positions[order]] = self._shard(int(shard_id))[rows[order]]
+        return features
+
+
+class FeatureSequence(tf.keras.utils.Sequence):
+    """Streams cached features to `fit`; each epoch picks one random draw per image.
+
+    Draws come from the entries built with `augmenter` (the same ImageDataGenerator settings as
+    in `build`); with augmenter=None only the plain features are used.
+    """
+
+    def __init__(self, cache, image_paths, labels, num_classes = 2, batch_size = 32, shuffle = True,
+                 augmenter = None, seed = None):
+        super().__init__()
+        self.cache = cache
+        self.labels = np.asarray(labels)
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+
+        self.keys = [cache.available_keys(path, augmenter) for path in image_paths]
+        self.num_draws = np.array([len(keys) for keys in self.keys])
+        missing = np.flatnonzero(self.num_draws == 0)
+        if len(missing):
+            raise ValueError(f'{len(missing)} images are not cached yet, e.g. {image_paths[missing[0]]}: call cache.build() first')
+
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.keys) / self.batch_size))
+
+    def on_epoch_end(self):
+        self.order = self.rng.permutation(len(self.keys)) if self.shuffle else np.arange(len(self.keys))
+        self.epoch_draws = (self.rng.random(len(self.keys)) * self.num_draws).astype(int)
+
+    def __getitem__(self, index):
+        rows = self.order[index * self.batch_size : (index + 1) * self.batch_size]
+        keys = [self.keys[row][self.epoch_draws[row]] for row in rows]
+        features = self.cache.get(keys)
+        labels = self.labels[rows]
+        if self.num_classes > 2:
+            labels = tf.keras.utils.to_categorical(labels, num_classes=self.num_classes)
+        return features, labels
+
+
+def build_head(feature_shape, num_classes = 2, hidden_units = 1024, dropout = 0.2):
+    """The notebooks' head (Flatten -> Dense -> Dropout -> classifier) on cached features."""
+    inputs = layers.Input(shape=feature_shape)
+    x = layers.Flatten()(inputs)
+    x = layers.Dense(hidden_units, activation='relu')(x)
+    x = layers.Dropout(dropout)(x)
+    if num_classes > 2:
+        outputs = layers.Dense(num_classes, activation='softmax')(x)
+    else:
+        outputs = layers.Dense(1, activation='sigmoid')(x)
+    return Model(inputs=inputs, outputs=outputs)
+
+
+def attach_head(feature_model, head):
+    """Full model for inference on images (rescaling still happens outside, as with the generators)."""
+    return Model(inputs=feature_model.input, outputs=head(feature_model.output))
+
+
+BACKBONES = {
+    'vgg16': 'VGG16',
+    'inception_v3': 'InceptionV3',
+    'resnet50': 'ResNet50',
+    'mobilenet': 'MobileNet',
+    'xception': 'Xception',
+    'efficientnet_b0': 'EfficientNetB0',
+}
+
+
+def load_backbone(name, image_size = (150, 150)):
+    application = getattr(tf.keras.applications, BACKBONES[name])
+    return application(input_shape=(*image_size, 3), include_top=False, weights='imagenet')
+
+
+def benchmark(cache, train_dir, paths, labels, num_classes, batch_size = 32):
+    """One epoch of the notebooks' frozen-backbone model on the generator vs. the head on the cache."""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    class_mode = 'categorical' if num_classes > 2 else 'binary'
+    generator = ImageDataGenerator(rescale=cache.rescale).flow_from_directory(
+        train_dir, target_size=cache.image_size, batch_size=batch_size, class_mode=class_mode)
+    loss = 'categorical_crossentropy' if num_classes > 2 else 'binary_crossentropy'
+
+    full_model = attach_head(cache.feature_model, build_head(cache.feature_shape, num_classes))
+    full_model.compile(optimizer='adam', loss=loss)
+    start = time.perf_counter()
+    full_model.fit(generator, epochs=1, verbose=0)
+    generator_seconds = time.perf_counter() - start
+
+    head = build_head(cache.feature_shape, num_classes)
+    head.compile(optimizer='adam', loss=loss)
+    start = time.perf_counter()
+    head.fit(FeatureSequence(cache, paths, labels, num_classes=num_classes, batch_size=batch_size), epochs=1, verbose=0)
+    cached_seconds = time.perf_counter() - start
+
+    return {
+        'images': len(paths),
+        'generator_epoch_seconds': generator_seconds,
+        'cached_epoch_seconds': cached_seconds,
+        'speedup': generator_seconds / cached_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cache frozen-backbone features and train the head on them')
+    parser.add_argument('--train-dir', required=True, help='one sub-directory per class, as for flow_from_directory')
+    parser.add_argument('--validation-dir', default=None)
+    parser.add_argument('--cache-dir', default='bottlenecks')
+    parser.add_argument('--backbone', default='vgg16', choices=sorted(BACKBONES))
+    parser.add_argument('--layer', default=None, help="cut layer, e.g. block5_pool (VGG16) or mixed7 (InceptionV3)")
+    parser.add_argument('--image-size', type=int, nargs=2, default=[150, 150])
+    parser.add_argument('--augment-draws', type=int, default=0, help='augmented copies cached per training image')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--output', default='head.keras', help='where to save the full image -> prediction model')
+    parser.add_argument('--benchmark', action='store_true', help='compare one epoch against flow_from_directory')
+    args = parser.parse_args()
+
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    cache = BottleneckCache(args.cache_dir, load_backbone(args.backbone, tuple(args.image_size)), layer_name=args.layer)
+    paths, labels, class_indices = images_from_directory(args.train_dir)
+    num_classes = len(class_indices)
+
+    augmenter = None
+    if args.augment_draws:
+        augmenter = ImageDataGenerator(rotation_range=40, width_shift_range=0.2, height_shift_range=0.2,
+                                       shear_range=0.2, zoom_range=0.2, horizontal_flip=True)
+    start = time.perf_counter()
+    computed = cache.build(paths, augmenter=augmenter, augment_draws=args.augment_draws)
+    print(f'{computed} feature rows computed in {time.perf_counter() - start:.1f}s -> {cache.cache_dir}')
+
+    if args.benchmark:
+        for name, value in benchmark(cache, args.train_dir, paths, labels, num_classes, batch_size=args.batch_size).items():
+            print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+        return
+
+    validation_data = None
+    if args.validation_dir:
+        validation_paths, validation_labels, _ = images_from_directory(args.validation_dir)
+        cache.build(validation_paths)
+        validation_data = FeatureSequence(cache, validation_paths, validation_labels, num_classes=num_classes,
+                                          batch_size=args.batch_size, shuffle=False)
+
+    head = build_head(cache.feature_shape, num_classes)
+    head.compile(optimizer=tf.keras.optimizers.RMSprop(learning_rate=1e-4),
+                 loss='categorical_crossentropy' if num_classes > 2 else 'binary_crossentropy',
+                 metrics=['accuracy'])
+    head.fit(FeatureSequence(cache, paths, labels, num_classes=num_classes, batch_size=args.batch_size,
+                             augmenter=augmenter),
+             validation_data=validation_data, epochs=args.epochs)
+
+    attach_head(cache.feature_model, head).save(args.output)
+    print(f'Model saved to {args.output}, classes: {class_indices}')
+
+
+if __name__ == '__main__':
+    main()
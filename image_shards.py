@@ -0,0 +1,256 @@
+"""Pre-decoded image shards for the Food, Emotions and Human-vs-Horse classifiers.
+
+`flow_from_directory` in Lab_1_Food_Classifier.ipynb, Lab_1_Emotions_Classification.ipynb and
+Human_vs_Horse_Classifier.ipynb decodes and resizes every JPEG again on every epoch. `pack`
+does that once and writes fixed-size records of raw uint8 pixels into binary shards:
+
+    shard_00000.bin   uint8 (shard_size x height x width x channels), last shard partially filled
+    labels.npy        int32 class index of every record
+    index.json        image size, shard layout, class_indices, source paths
+
+`ShardLoader` memory-maps the shards, shuffles across all of them every epoch and gathers
+batches on worker threads, a few batches ahead of the training loop:
+
+    loader = ShardLoader('horse_or_human_shards', batch_size=128, class_mode='binary')
+    model.fit(loader.repeat(), steps_per_epoch=len(loader), epochs=15)
+
+Example:
+    python image_shards.py pack --images ./horse-or-human --shards horse_or_human_shards --image-size 300 300
+    python image_shards.py benchmark --images ./horse-or-human --shards horse_or_human_shards --batches 20
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+INDEX_FILE = 'index.json'
+LABELS_FILE = 'labels.npy'
+# Same formats as ImageDataGenerator.flow_from_directory
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+
+def images_from_directory(directory):
+    """(paths, labels, class_indices) with the same classes, files and order as `flow_from_directory`.
+
+    Like keras, each class directory is walked recursively (symlinks not followed), sub-directories
+    in sorted order and files sorted within each of them.
+    """
+    classes = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    class_indices = {name: index for index, name in enumerate(classes)}
+    paths, labels = [], []
+    for name in classes:
+        for root, _, file_names in sorted(os.walk(os.path.join(directory, name)), key=lambda walk: walk[0]):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, file_name))
+                    labels.append(class_indices[name])
+    return paths, np.array(labels, dtype=np.int32), class_indices
+
+
+def shard_path(shards_dir, shard_id):
+    return os.path.join(shards_dir, f'shard_{shard_id:05d}.bin')
+
+
+def decode_image(path, image_size, color_mode = 'rgb'):
+    # Same decoding as keras `load_img(path, target_size=...)`: PIL, nearest-neighbour resize
+    with Image.open(path) as img:
+        img = img.convert('L' if color_mode == 'grayscale' else 'RGB')
+        if img.size != (image_size[1], image_size[0]):
+            img = img.resize((image_size[1], image_size[0]), Image.NEAREST)
+        array = np.asarray(img, dtype=np.uint8)
+    return array[..., np.newaxis] if array.ndim == 2 else array
+
+
+def pack(images_dir, shards_dir, image_size, color_mode = 'rgb', shard_size = 1024, num_workers = None):
+    """Decode and resize every image of a class-per-directory tree once and write the shards.
+
+    Images are decoded on `num_workers` threads (PIL releases the GIL while decoding). The index is
+    written last, so a directory without it is an incomplete pack.
+    """
+    paths, labels, class_indices = images_from_directory(images_dir)
+    image_size = tuple(image_size)
+    channels = 1 if color_mode == 'grayscale' else 3
+    record_shape = (*image_size, channels)
+    os.makedirs(shards_dir, exist_ok=True)
+    # Repacking into an existing directory: drop the old index and labels before any shard is
+    # rewritten, so a crash leaves an incomplete pack instead of mismatched data
+    for file_name in (INDEX_FILE, LABELS_FILE):
+        if os.path.exists(os.path.join(shards_dir, file_name)):
+            os.remove(os.path.join(shards_dir, file_name))
+
+    shards = []
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for shard_id, start in enumerate(range(0, len(paths), shard_size)):
+            shard_paths = paths[start : start + shard_size]
+            shard = np.memmap(shard_path(shards_dir, shard_id), dtype=np.uint8, mode='w+',
+                              shape=(shard_size, *record_shape))
+            for row, image in enumerate(executor.map(lambda path: decode_image(path, image_size, color_mode), shard_paths)):
+                shard[row] = image
+            shard.flush()
+            del shard
+            shards.append({'file': os.path.basename(shard_path(shards_dir, shard_id)), 'count': len(shard_paths)})
+
+    np.save(os.path.join(shards_dir, LABELS_FILE), labels)
+    with open(os.path.join(shards_dir, INDEX_FILE), 'w', encoding='UTF-8') as file:
+        json.dump({
+            'image_size': list(image_size),
+            'channels': channels,
+            'shard_size': shard_size,
+            'num_images': len(paths),
+            'class_indices': class_indices,
+            'shards': shards,
+            'paths': paths,
+        }, file, ensure_ascii=False)
+
+    return len(paths)
+
+
+class ShardLoader:
+    def __init__(self, shards_dir, batch_size = 32, shuffle = True, class_mode = 'categorical',
+                 rescale = 1./255, num_workers = 4, prefetch = 8, seed = None):
+        with open(os.path.join(shards_dir, INDEX_FILE), 'r', encoding='UTF-8') as file:
+            self.meta = json.load(file)
+        self.class_indices = self.meta['class_indices']
+        self.num_classes = len(self.class_indices)
+        self.shard_size = self.meta['shard_size']
+        self.labels = np.load(os.path.join(shards_dir, LABELS_FILE))
+        record_shape = (*self.meta['image_size'], self.meta['channels'])
+        # Read-only memory maps: pages are read (once) when a batch touches them, never decoded
+        self.shards = [
+            np.memmap(os.path.join(shards_dir, shard['file']), dtype=np.uint8, mode='r',
+                      shape=(self.shard_size, *record_shape))
+            for shard in self.meta['shards']
+        ]
+
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.class_mode = class_mode
+        self.rescale = rescale
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return int(np.ceil(len(self.labels) / self.batch_size))
+
+    def load_batch(self, records):
+        """Gather records (global indices) into a (batch, height, width, channels) array plus labels."""
+        records = np.sort(records)  # forward reads through each shard
+        shard_ids, rows = np.divmod(records, self.shard_size)
+        images = np.empty((len(records), *self.shards[0].shape[1:]), dtype=np.uint8)
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            images[positions] = self.shards[shard_id][rows[positions]]
+
+        x = images.astype(np.float32)
+        if self.rescale is not None:
+            x *= self.rescale
+
+        labels = self.labels[records]
+        if self.class_mode == 'categorical':
+            y = np.eye(self.num_classes, dtype=np.float32)[labels]
+        elif self.class_mode == 'binary':
+            y = labels.astype(np.float32)
+        else:
+            y = labels
+        return x, y
+
+    def __iter__(self):
+        """One epoch of batches, gathered on worker threads up to `prefetch` batches ahead."""
+        order = self.rng.permutation(len(self.labels)) if self.shuffle else np.arange(len(self.labels))
+        batches = [order[start : start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            pending = deque()
+            for records in batches[: self.prefetch]:
+                pending.append(executor.submit(self.load_batch, records))
+            for next_records in batches[self.prefetch :] + [None] * min(self.prefetch, len(batches)):
+                batch = pending.popleft().result()
+                if next_records is not None:
+                    pending.append(executor.submit(self.load_batch, next_records))
+                yield batch
+
+    def repeat(self):
+        """Endless generator over epochs, for `model.fit(..., steps_per_epoch=len(loader))`."""
+        while True:
+            yield from self.__iter__()
+
+
+def benchmark(images_dir, loader, num_batches = 20):
+    """images/sec of `flow_from_directory` (decode + resize per image) against the shard loader."""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    image_size = tuple(loader.meta['image_size'])
+    color_mode = 'grayscale' if loader.meta['channels'] == 1 else 'rgb'
+    generator = ImageDataGenerator(rescale=1./255).flow_from_directory(
+        images_dir, target_size=image_size, color_mode=color_mode, batch_size=loader.batch_size,
+        class_mode=loader.class_mode)
+    num_batches = min(num_batches, len(generator), len(loader))
+
+    start = time.perf_counter()
+    images = 0
+    for i in range(num_batches):
+        x, _ = generator[i]
+        images += len(x)
+    directory_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shard_images = 0
+    for i, (x, _) in enumerate(loader):
+        shard_images += len(x)
+        if i + 1 == num_batches:
+            break
+    shard_seconds = time.perf_counter() - start
+
+    results = {
+        'batches': num_batches,
+        'directory_images_per_sec': images / directory_seconds,
+        'shard_images_per_sec': shard_images / shard_seconds,
+    }
+    results['speedup'] = results['shard_images_per_sec'] / results['directory_images_per_sec']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-decoded image shards')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help='class-per-directory images -> shards')
+    pack_parser.add_argument('--images', required=True)
+    pack_parser.add_argument('--shards', required=True)
+    pack_parser.add_argument('--image-size', type=int, nargs=2, default=[300, 300], help='height width')
+    pack_parser.add_argument('--color-mode', default='rgb', choices=['rgb', 'grayscale'])
+    pack_parser.add_argument('--shard-size', type=int, default=1024, help='images per shard')
+    pack_parser.add_argument('--workers', type=int, default=None)
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='images/sec against flow_from_directory')
+    benchmark_parser.add_argument('--images', required=True)
+    benchmark_parser.add_argument('--shards', required=True)
+    benchmark_parser.add_argument('--batch-size', type=int, default=128)
+    benchmark_parser.add_argument('--batches', type=int, default=20)
+    benchmark_parser.add_argument('--class-mode', default='categorical', choices=['categorical', 'binary', 'sparse'])
+    benchmark_parser.add_argument('--workers', type=int, default=4)
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        start = time.perf_counter()
+        total = pack(args.images, args.shards, args.image_size, color_mode=args.color_mode,
+                     shard_size=args.shard_size, num_workers=args.workers)
+        seconds = time.perf_counter() - start
+        print(f'{total} images -> {args.shards} ({total / max(seconds, 1e-9):.0f} images/sec)')
+        return
+
+    loader = ShardLoader(args.shards, batch_size=args.batch_size, class_mode=args.class_mode, num_workers=args.workers)
+    for name, value in benchmark(args.images, loader, num_batches=args.batches).items():
+        print(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()